@@ -1,12 +1,23 @@
-from typing import Union
+import datetime
+from typing import Union, Optional
 
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, Body
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, Body, Query
 
 from api.api_models import AdminActionResponse, StatusEnum, AdminInsertUserModel, AdminUpdateUserModel, \
-    AdminSessionModel
+    AdminSessionModel, AdminBulkUpsertUsersModel
 from api.auth_utils import get_user
-from database.database import AsyncMongoClient
-from database.models import UserDbModel, UserRoles, SessionDbModel
+from config import get_settings
+from database.audit_writer import audit_writer
+from database.database import AsyncMongoClient, get_db, ROLLUP_STEPS
+from database.models import UserDbModel, UserRoles, SessionDbModel, RollupGranularityEnum, RollupGroupEnum
+from telegram.client_pool import client_pool
+from telegram.dialog_snapshot import dialog_snapshot
+from telegram.entity_cache import entity_cache
+from telegram.media_cache import media_cache
+from telegram.mongo_session import MongoSession
+from telegram.session_leases import session_leases
+
+settings = get_settings()
 
 router = APIRouter()
 
@@ -14,10 +25,10 @@ router = APIRouter()
 @router.get(path="/admins/admin_get_all_users", name="admins:get_all_users", tags=["admins"],
             description="Get all users (operators and admins) information"
             )
-async def admin_get_all_users(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+async def admin_get_all_users(user: Union[UserDbModel, None] = Depends(get_user),
+                              db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
     try:
         if user.user_role == UserRoles.admin and user.active:
-            db = AsyncMongoClient()
             all_users = await db.get_all_users_by_admin()
             return AdminActionResponse(status=StatusEnum.success, data={"all_users": all_users})
         else:
@@ -32,10 +43,10 @@ async def admin_get_all_users(user: Union[UserDbModel, None] = Depends(get_user)
              description="Create operator or admin"
              )
 async def admin_create_user(new_user: AdminInsertUserModel,
-                            user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+                            user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
     try:
         if user.user_role == UserRoles.admin and user.active:
-            db = AsyncMongoClient()
             new_id = await db.add_user_by_admin(new_user=new_user)
             return AdminActionResponse(status=StatusEnum.success, data={"new_user_id": new_id})
         else:
@@ -49,10 +60,10 @@ async def admin_create_user(new_user: AdminInsertUserModel,
 @router.post(path="/admins/admin_update_user", name="admins:update_user", tags=["admins"],
              description="Update operator or admin information including changing active status"
              )
-async def admin_update_user(username: str, new_user_data: AdminUpdateUserModel, user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+async def admin_update_user(username: str, new_user_data: AdminUpdateUserModel, user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
     try:
         if user.user_role == UserRoles.admin and user.active:
-            db = AsyncMongoClient()
             user_id = await db.update_user_by_admin(username=username, user_new_data=new_user_data)
             return AdminActionResponse(status=StatusEnum.success, data={"user_id": user_id})
         else:
@@ -66,10 +77,10 @@ async def admin_update_user(username: str, new_user_data: AdminUpdateUserModel,
 @router.post(path="/admins/admin_delete_user", name="admins:delete_user", tags=["admins"],
              description="Delete operators and admin"
              )
-async def admin_delete_user(username: str, user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+async def admin_delete_user(username: str, user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
     try:
         if user.user_role == UserRoles.admin and user.active:
-            db = AsyncMongoClient()
             delete_count = await db.delete_user_by_admin(username=username)
             return AdminActionResponse(status=StatusEnum.success, data={"delete_count": delete_count})
         else:
@@ -83,22 +94,25 @@ async def admin_delete_user(username: str, user: Union[UserDbModel, None] = Depe
 @router.post(path="/admins/add_session", name="admins:add_session", tags=["admins"],
              description="Add new session to db"
              )
-async def admin_add_session(session_data: AdminSessionModel = Body(), session_file: UploadFile = None, user: Union[UserDbModel, None] = Depends(get_user)):
+async def admin_add_session(session_data: AdminSessionModel = Body(), session_file: UploadFile = None, user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)):
     try:
-        db = AsyncMongoClient()
         if user.user_role == UserRoles.admin and user.active:
             if session_file is not None:
                 session_name = f"sessions/{session_file.filename}"
                 with open(session_name, "wb") as file:
                     file.write(session_file.file.read())
-                await db.add_new_session(
+                session_id = await db.add_new_session(
                     session_data=SessionDbModel(
                         session_file_name=session_file.filename,
                         telegram_api_id=session_data.telegram_api_id,
                         telegram_api_hash=session_data.telegram_api_hash
                     )
                 )
-                return AdminActionResponse(status=StatusEnum.success, data={"session_name": session_file.filename})
+                if settings.TELEGRAM_SESSION_STORAGE == "mongo":
+                    await MongoSession.load(session_id=session_id, db=db, session_file_name=session_file.filename)
+                return AdminActionResponse(status=StatusEnum.success,
+                                           data={"session_name": session_file.filename, "session_id": session_id})
             else:
                 return AdminActionResponse(status=StatusEnum.failure, data={"error": "file is empty"})
         else:
@@ -112,9 +126,9 @@ async def admin_add_session(session_data: AdminSessionModel = Body(), session_fi
 @router.get(path="/admins/get_available_sessions", name="admins:get_available_sessions", tags=["admins"],
              description="Get available sessions' names"
              )
-async def admin_get_sessions(user: Union[UserDbModel, None] = Depends(get_user)):
+async def admin_get_sessions(user: Union[UserDbModel, None] = Depends(get_user),
+                             db: AsyncMongoClient = Depends(get_db)):
     try:
-        db = AsyncMongoClient()
         if user.user_role == UserRoles.admin and user.active:
             sessions = await db.get_all_sessions_by_admin()
             return AdminActionResponse(status=StatusEnum.success, data={"sessions": str(sessions)})
@@ -130,9 +144,9 @@ async def admin_get_sessions(user: Union[UserDbModel, None] = Depends(get_user))
 @router.post(path="/admins/delete_session", name="admins:delete_session", tags=["admins"],
              description="Delete session file from system"
              )
-async def admin_delete_session(session_id: str, user: Union[UserDbModel, None] = Depends(get_user)):
+async def admin_delete_session(session_id: str, user: Union[UserDbModel, None] = Depends(get_user),
+                               db: AsyncMongoClient = Depends(get_db)):
     try:
-        db = AsyncMongoClient()
         if user.user_role == UserRoles.admin and user.active:
             result = await db.delete_session_by_admin(session_id=session_id)
             return AdminActionResponse(status=StatusEnum.success, data={"deleted": result})
@@ -142,4 +156,109 @@ async def admin_delete_session(session_id: str, user: Union[UserDbModel, None] =
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"{ex}"
-        )
\ No newline at end of file
+        )
+
+@router.get(path="/admins/get_client_pool_stats", name="admins:get_client_pool_stats", tags=["admins"],
+            description="Get telegram client pool size, idle ttl and usage of current worker"
+            )
+async def admin_get_client_pool_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"client_pool": client_pool.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.get(path="/admins/get_entity_cache_stats", name="admins:get_entity_cache_stats", tags=["admins"],
+            description="Get entity cache hit/miss counters of current worker"
+            )
+async def admin_get_entity_cache_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"entity_cache": entity_cache.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.get(path="/admins/get_audit_writer_stats", name="admins:get_audit_writer_stats", tags=["admins"],
+            description="Get audit write-behind buffer depth and flush latency of current worker"
+            )
+async def admin_get_audit_writer_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"audit_writer": audit_writer.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.get(path="/admins/get_session_lease_stats", name="admins:get_session_lease_stats", tags=["admins"],
+            description="Get telegram sessions leased by current worker"
+            )
+async def admin_get_session_lease_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"session_leases": session_leases.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.post(path="/admins/admin_bulk_upsert_users", name="admins:bulk_upsert_users", tags=["admins"],
+             description="Create or update many operators at once, returns result for every row"
+             )
+async def admin_bulk_upsert_users(users_data: AdminBulkUpsertUsersModel,
+                                  user: Union[UserDbModel, None] = Depends(get_user),
+                                  db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
+    try:
+        if user.user_role == UserRoles.admin and user.active:
+            results = await db.bulk_upsert_users_by_admin(users=users_data.users)
+            return AdminActionResponse(status=StatusEnum.success, data={"results": results})
+        else:
+            return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{ex}"
+        )
+
+@router.get(path="/admins/get_dialog_snapshot_stats", name="admins:get_dialog_snapshot_stats", tags=["admins"],
+            description="Get dialog snapshot update events and syncs of current worker"
+            )
+async def admin_get_dialog_snapshot_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"dialog_snapshot": dialog_snapshot.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.get(path="/admins/get_media_cache_stats", name="admins:get_media_cache_stats", tags=["admins"],
+            description="Get media cache hit rate and upload bytes saved of current worker"
+            )
+async def admin_get_media_cache_stats(user: Union[UserDbModel, None] = Depends(get_user)) -> AdminActionResponse:
+    if user.user_role == UserRoles.admin and user.active:
+        return AdminActionResponse(status=StatusEnum.success, data={"media_cache": media_cache.stats()})
+    else:
+        return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+
+@router.get(path="/admins/get_action_analytics", name="admins:get_action_analytics", tags=["admins"],
+            description="Get action counts and failures per operator or session from pre-aggregated "
+                        "minute, hour or day buckets"
+            )
+async def admin_get_action_analytics(granularity: RollupGranularityEnum = Query(default=RollupGranularityEnum.day),
+                                     start: Optional[datetime.datetime] = Query(
+                                         default=None, description="first bucket, 30 buckets before end by default"),
+                                     end: Optional[datetime.datetime] = Query(default=None,
+                                                                              description="now by default"),
+                                     group_by: RollupGroupEnum = Query(default=RollupGroupEnum.username),
+                                     username: Optional[str] = Query(default=None, description="only this operator"),
+                                     session_id: Optional[str] = Query(default=None, description="only this session"),
+                                     user: Union[UserDbModel, None] = Depends(get_user),
+                                     db: AsyncMongoClient = Depends(get_db)) -> AdminActionResponse:
+    try:
+        if user.user_role == UserRoles.admin and user.active:
+            end = end or datetime.datetime.now()
+            start = start or end - ROLLUP_STEPS[granularity] * 30
+            if (end - start) / ROLLUP_STEPS[granularity] > settings.ANALYTICS_MAX_BUCKETS:
+                return AdminActionResponse(status=StatusEnum.failure, data={
+                    "error": f"range is longer than {settings.ANALYTICS_MAX_BUCKETS} {granularity.value} buckets"
+                })
+            rollups = await db.get_action_rollups(granularity=granularity, start=start, end=end, group_by=group_by,
+                                                  username=username, session_id=session_id)
+            return AdminActionResponse(status=StatusEnum.success, data={"rollups": rollups})
+        else:
+            return AdminActionResponse(status=StatusEnum.failure, data={"error": "you are not admin or disabled admin"})
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{ex}"
+        )
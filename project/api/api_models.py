@@ -1,10 +1,11 @@
+import datetime
 import json
 from enum import Enum
 from typing import Optional, List
 
 from pydantic import BaseModel, Field, model_validator
 
-from database.models import UserRoles, MessageDbModel
+from database.models import UserRoles, MessageDbModel, ActionsEnum, JobStatusEnum, PeerTypeEnum, UploadProgressDbModel
 
 
 class StatusEnum(str, Enum):
@@ -15,6 +16,8 @@ class SendMessageModel(BaseModel):
     chat_id: int = Field(description="chat id for sending message", default=0)
     text_message: str = Field(description="message for sending", default="")
     if_channel: bool = Field(description="channel or not", default=False)
+    upload_id: Optional[str] = Field(description="id to poll upload progress of files at /users/uploads/{upload_id}",
+                                     default=None, min_length=1, max_length=128)
 
     @model_validator(mode="before")
     @classmethod
@@ -54,6 +57,80 @@ class LikeMessageModel(BaseModel):
 class LikeMessageModelResponse(BaseModel):
     status: StatusEnum = Field(description="operation status")
 
+class BulkSendMessageModel(BaseModel):
+    chat_ids: List[int] = Field(description="chat ids for sending message", min_length=1, max_length=1000)
+    text_message: str = Field(description="message for sending", default="")
+    if_channel: bool = Field(description="channels or not", default=False)
+    upload_id: Optional[str] = Field(description="id to poll upload progress of files at /users/uploads/{upload_id}",
+                                     default=None, min_length=1, max_length=128)
+
+    @model_validator(mode="before")
+    @classmethod
+    def validate_to_json(cls, value):
+        if isinstance(value, str):
+            return cls(**json.loads(value))
+        return value
+
+class BulkLikeTargetModel(BaseModel):
+    chat_id: int = Field(description="chat id to like")
+    message_id: int = Field(description="message id to like")
+
+class BulkLikeMessageModel(BaseModel):
+    targets: List[BulkLikeTargetModel] = Field(description="messages to like", min_length=1, max_length=1000)
+    emoticon: str = Field(description="reaction icon", default="👍")
+
+class BulkCommentTargetModel(BaseModel):
+    channel_id: int = Field(description="channel id to comment")
+    message_id: int = Field(description="message id to comment")
+
+class BulkCommentMessageModel(BaseModel):
+    targets: List[BulkCommentTargetModel] = Field(description="messages to comment", min_length=1, max_length=1000)
+    comment: str = Field(description="text comment to messages")
+
+class BulkItemResultModel(BaseModel):
+    index: int = Field(description="index of target in request")
+    status: StatusEnum = Field(description="operation status")
+    data: dict = Field(description="operation result data", default={})
+
+class RateLimitStatusModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    data: dict = Field(description="queue depth, expected wait and flood wait (seconds) per operation kind",
+                       default={})
+
+class UploadProgressModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    data: UploadProgressDbModel = Field(description="progress of files of the request")
+
+class HealthModelResponse(BaseModel):
+    status: StatusEnum = Field(description="success when every check passed")
+    checks: dict = Field(description="result of each check", default={})
+    warm_start: dict = Field(description="time to ready, pre-connected sessions and first request latency",
+                             default={})
+
+class JobSubmittedModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    job_id: str = Field(description="id of accepted job")
+
+class JobModel(BaseModel):
+    job_id: str = Field(description="job id")
+    job_type: ActionsEnum = Field(description="operation of job")
+    username: str = Field(description="user who submitted the job")
+    status: JobStatusEnum = Field(description="job status")
+    result: dict = Field(description="operation result", default={})
+    error: Optional[str] = Field(description="error of failed job", default=None)
+    attempts: int = Field(description="number of times the job was started")
+    created_at: datetime.datetime = Field(description="job creation time")
+    updated_at: datetime.datetime = Field(description="last job update time")
+
+class JobModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    data: JobModel = Field(description="job")
+
+class JobListModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    data: List[JobModel] = Field(description="jobs, newest first", default=[])
+    next_cursor: Optional[str] = Field(description="value of 'before' to request the next page", default=None)
+
 class TwoFAModel(BaseModel):
     current_password: Optional[str] = Field(description="current password, ignore if 2fa not activated", default=None)
     new_password: Optional[str] = Field(description="new password, ignore to reset 2fa", default=None)
@@ -61,9 +138,28 @@ class TwoFAModel(BaseModel):
 class TwoFAModelResponse(BaseModel):
     status: StatusEnum = Field(description="operation status")
 
+class DialogModel(BaseModel):
+    id: int = Field(description="marked peer id of dialog")
+    title: str = Field(description="dialog title")
+    type: PeerTypeEnum = Field(description="dialog peer type")
+    unread_count: int = Field(description="number of unread messages")
+    date: Optional[datetime.datetime] = Field(description="date of the last message", default=None)
+    top_message_id: int = Field(description="id of the last message", default=0)
+
+class DialogSnapshotItemModel(DialogModel):
+    version: int = Field(description="snapshot version of the last change of dialog")
+    deleted: bool = Field(description="dialog was left or removed", default=False)
+
+class DialogSnapshotModelResponse(BaseModel):
+    status: StatusEnum = Field(description="operation status")
+    synced: bool = Field(description="snapshot was built, false while it is built in background")
+    version: int = Field(description="pass as 'since' to get changes after this response")
+    data: List[DialogSnapshotItemModel] = Field(description="dialogs or changed dialogs", default=[])
+
 class GetHistoryModelResponse(BaseModel):
     status: StatusEnum = Field(description="operation status")
     data: List[MessageDbModel] = Field(description="history of messaging", default=[])
+    next_cursor: Optional[str] = Field(description="value of 'before' to request the next page", default=None)
 
 class AdminInsertUserModel(BaseModel):
     new_username: str = Field(description="new username")
@@ -81,6 +177,17 @@ class AdminUpdateUserModel(BaseModel):
     updated_user_role: Optional[UserRoles] = Field(description="updated user role", default=None)
     updated_user_active: Optional[bool] = Field(description="if user active or disabled", default=None)
 
+class AdminBulkUserModel(BaseModel):
+    username: str = Field(description="username of created or updated user")
+    user_password: Optional[str] = Field(description="password, required for new user", default=None)
+    user_session_id: Optional[str] = Field(description="user session id, required for new user", default=None)
+    user_description: Optional[str] = Field(description="user description", default=None)
+    user_role: Optional[UserRoles] = Field(description="user role", default=None)
+    active: Optional[bool] = Field(description="if user active or disabled", default=None)
+
+class AdminBulkUpsertUsersModel(BaseModel):
+    users: List[AdminBulkUserModel] = Field(description="users to create or update", min_length=1, max_length=1000)
+
 class AdminSessionModel(BaseModel):
     telegram_api_id: int = Field(description="telegram api id")
     telegram_api_hash: str = Field(description="telegram api hash")
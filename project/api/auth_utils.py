@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from typing import Union
 
@@ -8,13 +10,16 @@ from passlib.context import CryptContext
 from pydantic import BaseModel
 
 from config import get_settings
-from database.database import AsyncMongoClient
+from database.database import AsyncMongoClient, get_db
 from database.models import UserDbModel
+from database.user_cache import user_cache
 
 settings = get_settings()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password_hash")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
@@ -22,18 +27,19 @@ class TokenData(BaseModel):
     user_login: Union[str, None] = None
 
 
-def verify_password(plain_password, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify, plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
 
-async def authenticate_user(login: str, password: str) -> Union[UserDbModel, None]:
+async def authenticate_user(db: AsyncMongoClient, login: str, password: str) -> Union[UserDbModel, None]:
     try:
-        db = AsyncMongoClient()
         user: Union[UserDbModel, None] = await db.get_user_by_login(username=login)
-        if user and user.active and verify_password(password, user.user_hashed_password):
+        if user and user.active and await verify_password(password, user.user_hashed_password):
             return user
         else:
             return None
@@ -52,7 +58,8 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     return encoded_jwt
 
 
-async def get_user(token: str = Depends(oauth2_scheme)) -> Union[UserDbModel, None]:
+async def get_user(token: str = Depends(oauth2_scheme),
+                   db: AsyncMongoClient = Depends(get_db)) -> Union[UserDbModel, None]:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -64,8 +71,11 @@ async def get_user(token: str = Depends(oauth2_scheme)) -> Union[UserDbModel, No
         if user_login is None:
             raise credentials_exception
         token_data = TokenData(user_login=user_login)
-        db = AsyncMongoClient()
-        user: Union[UserDbModel, None] = await db.get_user_by_login(username=token_data.user_login)
+        user: Union[UserDbModel, None] = user_cache.get(token_data.user_login)
+        if user is None:
+            generation = user_cache.generation
+            user = await db.get_user_by_login(username=token_data.user_login)
+            user_cache.put(username=token_data.user_login, user=user, generation=generation)
         if user:
             return user
         else:
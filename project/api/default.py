@@ -1,12 +1,18 @@
+import asyncio
 from datetime import timedelta
 from typing import Union
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
+from api.api_models import StatusEnum, HealthModelResponse
 from api.auth_utils import authenticate_user, create_access_token
+from database.database import AsyncMongoClient, get_db
 from database.models import UserDbModel
 from config import get_settings
+from metrics import metrics_exchange
+from telegram.warm_start import warm_start
 
 settings = get_settings()
 
@@ -15,8 +21,8 @@ router = APIRouter()
 @router.post(path="/login", name="login", tags=["default"],
              description="Get access token by username and password"
              )
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user: Union[UserDbModel, None] = await authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncMongoClient = Depends(get_db)):
+    user: Union[UserDbModel, None] = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -25,4 +31,40 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get(path="/metrics", name="metrics", tags=["default"],
+            description="Latency histograms, error counters and gauges in Prometheus text format. With "
+                        "METRICS_MULTIPROC_DIR set they cover every worker: counters and histograms summed, gauges "
+                        "labeled by worker, others than the serving one up to METRICS_WRITE_INTERVAL old. "
+                        "Not proxied by nginx, scrape web:8000 inside the compose network"
+            )
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(content=metrics_exchange.render(), media_type="text/plain; version=0.0.4")
+
+@router.get(path="/health/live", name="health:live", tags=["default"],
+            description="Worker process is up and its event loop responds"
+            )
+async def health_live() -> HealthModelResponse:
+    return HealthModelResponse(status=StatusEnum.success, checks={"live": True})
+
+@router.get(path="/health/ready", name="health:ready", tags=["default"],
+            description="Mongo answers and warm start finished, 503 until then so the proxy holds back traffic. "
+                        "With METRICS_MULTIPROC_DIR set, warm start of all WEB_WORKERS workers is required"
+            )
+async def health_ready(db: AsyncMongoClient = Depends(get_db)) -> JSONResponse:
+    checks = {"warm_start": warm_start.ready, "mongo": True}
+    try:
+        await asyncio.wait_for(db.ping(), timeout=settings.HEALTH_MONGO_TIMEOUT)
+    except Exception:
+        checks["mongo"] = False
+    if metrics_exchange.enabled:
+        # whichever worker answers the probe, the server takes traffic on all of them
+        ready_workers = [snapshot.get("warm_start_ready") for snapshot in metrics_exchange.snapshots().values()]
+        checks["workers"] = ready_workers.count(1) >= settings.WEB_WORKERS
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=HealthModelResponse(status=StatusEnum.success if ready else StatusEnum.failure, checks=checks,
+                                    warm_start=warm_start.stats()).model_dump()
+    )
@@ -0,0 +1,281 @@
+import asyncio
+import datetime
+import json
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Union, List, Callable, Awaitable, Dict, AsyncIterator
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile
+
+from api import users
+from api.api_models import (StatusEnum, SendMessageModel, SubscribeChannelModel, CommentMessageModel,
+                            LikeMessageModel, JobModel, JobModelResponse, JobListModelResponse, TwoFAModel,
+                            BulkSendMessageModel, BulkLikeMessageModel, BulkCommentMessageModel)
+from api.auth_utils import get_user
+from config import get_settings, get_worker_id
+from database.database import AsyncMongoClient, get_db, InvalidCursorError
+from database.job_events import job_events
+from database.models import UserDbModel, UserRoles, ActionsEnum, JobDbModel, JobStatusEnum, JobEventEnum
+from metrics import registry
+from telegram.session_leases import session_leases
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# same threshold starlette spools multipart uploads to disk with
+JOB_FILE_SPOOL_SIZE = 1024 * 1024
+
+JobHandler = Callable[[AsyncMongoClient, UserDbModel, JobDbModel], Awaitable]
+
+
+@router.get(path="/users/jobs", name="users:jobs", tags=["users"],
+            description="Get submitted jobs, newest first. Admins see jobs of all users"
+            )
+async def get_jobs(job_status: Union[JobStatusEnum, None] = Query(default=None, alias="status"),
+                   limit: int = Query(default=10, ge=1, le=1000),
+                   before: Union[str, None] = Query(default=None),
+                   user: Union[UserDbModel, None] = Depends(get_user),
+                   db: AsyncMongoClient = Depends(get_db)) -> JobListModelResponse:
+    try:
+        username = None if user.user_role == UserRoles.admin and user.active else user.username
+        jobs, next_cursor = await db.get_jobs(username=username, job_status=job_status, limit=limit, before=before)
+        return JobListModelResponse(status=StatusEnum.success, data=[__to_job_model(job) for job in jobs],
+                                    next_cursor=next_cursor)
+    except InvalidCursorError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{ex}"
+        )
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{ex}"
+        )
+
+@router.get(path="/users/jobs/{job_id}", name="users:job", tags=["users"],
+            description="Get status and result of submitted job"
+            )
+async def get_job(job_id: str, user: Union[UserDbModel, None] = Depends(get_user),
+                  db: AsyncMongoClient = Depends(get_db)) -> JobModelResponse:
+    try:
+        job = await db.get_job(job_id=job_id)
+    except InvalidId:
+        job = None
+    if job is None or (job["username"] != user.username and not (user.user_role == UserRoles.admin and user.active)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="job not found"
+        )
+    return JobModelResponse(status=StatusEnum.success, data=__to_job_model(job))
+
+def __to_job_model(job: dict) -> JobModel:
+    return JobModel(job_id=str(job["_id"]), **JobDbModel.model_validate(job).model_dump(
+        include={"job_type", "username", "status", "result", "error", "attempts", "created_at", "updated_at"}
+    ))
+
+
+@asynccontextmanager
+async def job_upload_files(db: AsyncMongoClient, job: JobDbModel) -> AsyncIterator[Union[List[UploadFile], None]]:
+    upload_files = []
+    try:
+        for file in job.files:
+            spool = tempfile.SpooledTemporaryFile(max_size=JOB_FILE_SPOOL_SIZE)
+            upload_files.append(UploadFile(file=spool, filename=file.filename, size=file.size))
+            await db.download_job_file(file_id=file.file_id, destination=spool)
+            spool.seek(0)
+        yield upload_files or None
+    finally:
+        for upload_file in upload_files:
+            upload_file.file.close()
+
+
+async def run_send_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    async with job_upload_files(db=db, job=job) as upload_files:
+        return await users.send_message(message=SendMessageModel.model_validate(job.payload),
+                                        upload_files=upload_files, user=user, db=db, async_mode=False)
+
+
+async def run_subscribe_channel(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.subscribe_channel(subscribe_data=SubscribeChannelModel.model_validate(job.payload),
+                                         user=user, db=db, async_mode=False)
+
+
+async def run_comment_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.comment_message(comment_data=CommentMessageModel.model_validate(job.payload),
+                                       user=user, db=db, async_mode=False)
+
+
+async def run_like_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.like_message(like_data=LikeMessageModel.model_validate(job.payload),
+                                    user=user, db=db, async_mode=False)
+
+
+async def run_enable_2fa(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.enable_2fa(twofa_data=TwoFAModel.model_validate(job.payload), user=user, db=db)
+
+
+async def run_get_dialogs(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    offset_date = job.payload["offset_date"]
+    return await users.get_dialogs(
+        limit=job.payload["limit"],
+        offset_date=datetime.datetime.fromisoformat(offset_date) if offset_date is not None else None,
+        offset_id=job.payload["offset_id"], offset_peer_id=job.payload["offset_peer_id"], user=user, db=db
+    )
+
+
+async def run_bulk_send_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    # the files are uploaded to telegram before the response is returned, its lines only send the messages
+    async with job_upload_files(db=db, job=job) as upload_files:
+        return await users.bulk_send_message(message=BulkSendMessageModel.model_validate(job.payload),
+                                             upload_files=upload_files, user=user, db=db)
+
+
+async def run_bulk_like_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.bulk_like_message(like_data=BulkLikeMessageModel.model_validate(job.payload), user=user, db=db)
+
+
+async def run_bulk_comment_message(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.bulk_comment_message(comment_data=BulkCommentMessageModel.model_validate(job.payload),
+                                            user=user, db=db)
+
+
+async def run_rate_limit_status(db: AsyncMongoClient, user: UserDbModel, job: JobDbModel):
+    return await users.rate_limit_status(user=user, db=db)
+
+
+JOB_HANDLERS: Dict[ActionsEnum, JobHandler] = {
+    ActionsEnum.send_message: run_send_message,
+    ActionsEnum.subscribe_channel: run_subscribe_channel,
+    ActionsEnum.comment_message: run_comment_message,
+    ActionsEnum.like_message: run_like_message,
+    ActionsEnum.enable_2fa: run_enable_2fa,
+    ActionsEnum.get_dialogs: run_get_dialogs,
+    ActionsEnum.bulk_send_message: run_bulk_send_message,
+    ActionsEnum.bulk_like_message: run_bulk_like_message,
+    ActionsEnum.bulk_comment_message: run_bulk_comment_message,
+    ActionsEnum.rate_limit_status: run_rate_limit_status,
+}
+
+
+class JobRunner:
+    """Workers that claim queued jobs from Mongo under a renewable lease and run the matching handler."""
+
+    def __init__(self, workers: int, poll_interval: float, lease_seconds: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = get_worker_id()
+        self.active_jobs = 0
+        self.__db: Union[AsyncMongoClient, None] = None
+        self.__tasks: List[asyncio.Task] = []
+
+    def start(self, db: AsyncMongoClient):
+        self.__db = db
+        self.__tasks = [asyncio.create_task(self.__work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
+
+    async def __work(self):
+        while True:
+            try:
+                job = await self.__db.claim_job(owner=self.owner, lease_seconds=self.lease_seconds,
+                                                excluded_sessions=await session_leases.foreign_sessions())
+            except Exception as ex:
+                logger.error(f"cannot claim job: {ex}")
+                job = None
+            if job is None:
+                await job_events.wait_queued(timeout=self.poll_interval)
+                continue
+            job_model = JobDbModel.model_validate(job)
+            if job_model.session_id is not None and not await session_leases.try_acquire(job_model.session_id):
+                # another worker took the session after the claim: back off, or it is claimed again right away
+                not_before = datetime.datetime.now() + datetime.timedelta(seconds=self.poll_interval)
+                await self.__db.requeue_job(job_id=job["_id"], not_before=not_before)
+                continue
+            await self.__run(job_id=job["_id"], job=job_model)
+
+    async def __run(self, job_id: ObjectId, job: JobDbModel):
+        heartbeat = asyncio.create_task(self.__heartbeat(job_id))
+        self.active_jobs += 1
+        try:
+            user = await self.__db.get_user_by_login(username=job.username)
+            if not user.active:
+                raise RuntimeError("user is disabled")
+            result = await JOB_HANDLERS[job.job_type](self.__db, user, job)
+            await self.__db.finish_job(job_id=job_id, job_status=JobStatusEnum.succeeded,
+                                       result=await self.__job_result(job_id, result))
+            await job_events.publish(job_id=job_id, event=JobEventEnum.finished)
+            await self.__remove_files(job_id, job)
+        except HTTPException as ex:
+            if ex.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+                retry_after = int(ex.headers["Retry-After"])
+                await self.__db.requeue_job(
+                    job_id=job_id, not_before=datetime.datetime.now() + datetime.timedelta(seconds=retry_after)
+                )
+            else:
+                await self.__db.finish_job(job_id=job_id, job_status=JobStatusEnum.failed, error=f"{ex.detail}")
+                await job_events.publish(job_id=job_id, event=JobEventEnum.finished)
+                await self.__remove_files(job_id, job)
+        except Exception as ex:
+            await self.__db.finish_job(job_id=job_id, job_status=JobStatusEnum.failed, error=f"{ex}")
+            await job_events.publish(job_id=job_id, event=JobEventEnum.finished)
+            await self.__remove_files(job_id, job)
+        finally:
+            self.active_jobs -= 1
+            heartbeat.cancel()
+
+    @staticmethod
+    async def __job_result(job_id: ObjectId, result) -> dict:
+        if isinstance(result, StreamingResponse):
+            # NDJSON of a forwarded stream: relayed line by line to the waiting request, kept whole in the result
+            lines = []
+            async for line in result.body_iterator:
+                line = line if isinstance(line, str) else line.decode()
+                await job_events.publish(job_id=job_id, event=JobEventEnum.output,
+                                         data={"index": len(lines), "line": line})
+                lines.append(line)
+            return {"lines": lines}
+        if not isinstance(result, Response):
+            return result.model_dump()
+        # handlers answer with a plain response when they hand the operation over to another job
+        content = json.loads(result.body) if result.body else {}
+        if result.status_code >= status.HTTP_400_BAD_REQUEST:
+            raise HTTPException(status_code=result.status_code, detail=content.get("detail", content))
+        return content
+
+    async def __heartbeat(self, job_id: ObjectId):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.__db.renew_job_lease(job_id=job_id, owner=self.owner, lease_seconds=self.lease_seconds)
+            except Exception as ex:
+                logger.error(f"cannot renew lease of job {job_id}: {ex}")
+
+    async def __remove_files(self, job_id: ObjectId, job: JobDbModel):
+        if not job.files:
+            return
+        try:
+            await self.__db.delete_job_files(job_id=job_id)
+        except Exception as ex:
+            logger.error(f"cannot remove files of job {job_id}: {ex}")
+
+
+job_runner = JobRunner(
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    lease_seconds=settings.JOB_LEASE_SECONDS
+)
+
+registry.gauge("job_runner_active_jobs", "Jobs running on this worker", lambda: job_runner.active_jobs)
@@ -1,74 +1,127 @@
-import os
-from typing import Union, List
+import asyncio
+import datetime
+import json
+import math
+from typing import Union, List, Optional, Callable, Awaitable, Tuple, AsyncIterator, Dict
 
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, Body
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, Body, Query
+from bson import ObjectId
+from fastapi.responses import StreamingResponse, JSONResponse
 from telethon import TelegramClient
 from telethon.tl.functions.channels import JoinChannelRequest, LeaveChannelRequest
 from telethon.tl.functions.messages import SendReactionRequest
-from telethon.tl.types import InputChannel, PeerChannel, ReactionEmoji
+from telethon.tl.types import InputChannel, PeerChannel, ReactionEmoji, InputPeerEmpty, TypeInputPeer
 
 from api.api_models import (StatusEnum, SendMessageModel, SendMessageModelResponse,
                             SubscribeChannelModel, SubscribeChannelModelResponse,
                             CommentMessageModel, CommentMessageModelResponse,
                             LikeMessageModel, LikeMessageModelResponse, GetHistoryModelResponse, TwoFAModelResponse,
-                            TwoFAModel)
+                            TwoFAModel, BulkSendMessageModel, BulkLikeMessageModel, BulkCommentMessageModel,
+                            BulkItemResultModel, RateLimitStatusModelResponse,
+                            JobSubmittedModelResponse, DialogModel, DialogSnapshotItemModel,
+                            DialogSnapshotModelResponse, UploadProgressModelResponse)
 from api.auth_utils import get_user
-from database.database import AsyncMongoClient
-from database.models import UserDbModel, ActionsDbModel, ActionsEnum, MessageDbModel, SessionDbModel
-from telegram.telegram_client import TelegramAccount
+from config import get_settings
+from database.database import AsyncMongoClient, get_db, InvalidCursorError
+from database.job_events import job_events
+from database.models import UserDbModel, ActionsDbModel, ActionsEnum, MessageDbModel, SessionDbModel, JobDbModel, \
+    JobFileModel, JobStatusEnum, EntityDbModel, JobEventEnum
+from telegram.action_data import messages_action_data
+from telegram.client_pool import client_pool
+from telegram.dialog_snapshot import dialog_snapshot
+from telegram.entity_cache import entity_cache, get_input_channel, entity_to_db_model, DIALOGS_BATCH_SIZE
+from telegram.media_cache import media_cache
+from telegram.scheduler import scheduler, RpcKind, SchedulerBusyError
+from telegram.session_leases import session_leases
+from telegram.upload_progress import UploadProgress
+from telegram.uploads import upload_chunks
+
+settings = get_settings()
 
 router = APIRouter()
 
+ASYNC_MODE_DESCRIPTION = "accept the request, return job id with 202 and run it in background"
+# nginx buffers proxied responses by default, NDJSON lines must reach the client as they are produced
+NDJSON_HEADERS = {"X-Accel-Buffering": "no"}
+
+# background syncs started by snapshot reads, by session, so they are not collected mid-run or started twice
+__warm_tasks: Dict[str, asyncio.Task] = {}
+
+
 @router.post(path="/users/send_message", name="users:send_message", tags=["users"],
              description="Send text message with file or files of different formats(images, videos and others)"
              )
 async def send_message(message: SendMessageModel = Body(), upload_files: List[UploadFile] = None,
-                       user: Union[UserDbModel, None] = Depends(get_user)) -> SendMessageModelResponse:
-    db = AsyncMongoClient()
+                       user: Union[UserDbModel, None] = Depends(get_user),
+                       db: AsyncMongoClient = Depends(get_db),
+                       async_mode: bool = Query(default=False, description=ASYNC_MODE_DESCRIPTION)
+                       ) -> SendMessageModelResponse:
+    if async_mode or not await session_leases.try_acquire(user.user_session_id):
+        progress = __upload_progress(db=db, user=user, upload_id=message.upload_id, upload_files=upload_files)
+        if progress is not None:
+            # visible as pending while the job waits for its worker
+            await progress.start()
+        return await __submit_job(wait=not async_mode, db=db, user=user, job_type=ActionsEnum.send_message,
+                                  payload=message.model_dump(mode="json"), upload_files=upload_files)
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
+    account = await client_pool.acquire(session_id=user.user_session_id, session=session)
     try:
-        await account.get_dialogs()
-        item = await account.get_entity(message.chat_id)
+        item = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                   peer=message.chat_id)
         if upload_files is not None:
-            file_names = [f"temp/{file.filename}" for file in upload_files]
-            for i in range (0, len(upload_files)):
-                with open(file_names[i], "wb") as temp_file:
-                    temp_file.write(upload_files[i].file.read())
+            progress = __upload_progress(db=db, user=user, upload_id=message.upload_id, upload_files=upload_files)
+            prepared = await media_cache.prepare(db=db, session_id=user.user_session_id, upload_files=upload_files,
+                                                 progress=progress)
             caption = ["" for _ in upload_files]
             caption[-1] = message.text_message
-            result = await account.send_file(entity=item, caption=caption, file=file_names)
-            for file in file_names:
-                os.remove(file)
-            action_data = {}
+            result = await media_cache.send(db=db, client=account, prepared=prepared, send=lambda files: scheduler.run(
+                session_id=user.user_session_id, kind=RpcKind.send,
+                operation=lambda: account.send_file(entity=item, caption=caption, file=files)
+            ))
             for i in range(0, len(result)):
-                action_data[f"{i}"] = result[i].to_dict()
                 await db.safe_message(__get_data_from_message_object(
                     message=result[i], if_channel=message.if_channel, sender_username=user.username)
                 )
             action = ActionsDbModel(
+                username=user.username,
+                session_id=user.user_session_id,
                 action_status=True,
                 action_type=ActionsEnum.send_message,
-                action_data=action_data
+                action_data=messages_action_data(result)
             )
             await db.safe_log_action(log_action=action)
             return SendMessageModelResponse(status=StatusEnum.success, message_id=[message.id for message in result])
         else:
-            result = await account.send_message(entity=item, message=message.text_message)
+            result = await scheduler.run(
+                session_id=user.user_session_id, kind=RpcKind.send,
+                operation=lambda: account.send_message(entity=item, message=message.text_message)
+            )
             await db.safe_message(__get_data_from_message_object(
                 message=result, if_channel=message.if_channel, sender_username=user.username)
             )
             action = ActionsDbModel(
+                username=user.username,
+                session_id=user.user_session_id,
                 action_status=True,
                 action_type=ActionsEnum.send_message,
-                action_data=result.to_dict()
+                action_data=messages_action_data([result])
             )
             await db.safe_log_action(log_action=action)
             return SendMessageModelResponse(status=StatusEnum.success, message_id=[result.id])
+    except SchedulerBusyError as ex:
+        action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
+            action_status=False,
+            action_type=ActionsEnum.send_message,
+            action_data={"error": f"{ex}"}
+        )
+        await db.safe_log_action(log_action=action)
+        raise __rate_limited(ex)
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=False,
             action_type=ActionsEnum.send_message,
             action_data={"error": f"{ex}"}
@@ -79,55 +132,77 @@ async def send_message(message: SendMessageModel = Body(), upload_files: List[Up
             detail=f"{ex}"
         )
     finally:
-        await account.disconnect()
+        await client_pool.release(session_id=user.user_session_id)
 
 @router.post(path="/users/subscribe_channel", name="users:subscribe_channel", tags=["users"],
              description="Subscribe channel by name (t.me/something) or id"
              )
 async def subscribe_channel(subscribe_data: SubscribeChannelModel,
-                            user: Union[UserDbModel, None] = Depends(get_user)) -> SubscribeChannelModelResponse:
-    db = AsyncMongoClient()
+                            user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db),
+                            async_mode: bool = Query(default=False, description=ASYNC_MODE_DESCRIPTION)
+                            ) -> SubscribeChannelModelResponse:
+    if async_mode or not await session_leases.try_acquire(user.user_session_id):
+        return await __submit_job(wait=not async_mode, db=db, user=user, job_type=ActionsEnum.subscribe_channel,
+                                  payload=subscribe_data.model_dump(mode="json"))
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
+    account = await client_pool.acquire(session_id=user.user_session_id, session=session)
     try:
-        await account.get_dialogs()
-
         if subscribe_data.channel_id is None and subscribe_data.channel_name is None:
             raise RuntimeError("you should provide id or name of channel")
         elif subscribe_data.channel_name is not None:
-            item = await account.get_entity(subscribe_data.channel_name)
-            channel = InputChannel(item.id, item.access_hash)
+            item = await entity_cache.resolve(db=db, client=account, session_id=user.user_session_id,
+                                              peer=subscribe_data.channel_name)
         else:
-            item = await account.get_entity(PeerChannel(channel_id=subscribe_data.channel_id))
-            channel = InputChannel(item.id, item.access_hash)
+            item = await entity_cache.resolve(db=db, client=account, session_id=user.user_session_id,
+                                              peer=PeerChannel(channel_id=subscribe_data.channel_id))
+        channel = get_input_channel(item)
 
-        result = await __subscribe_channel(account=account, channel=channel, subscribe=subscribe_data.subscribe_flag)
+        result = await scheduler.run(
+            session_id=user.user_session_id, kind=RpcKind.join,
+            operation=lambda: __subscribe_channel(account=account, channel=channel,
+                                                  subscribe=subscribe_data.subscribe_flag)
+        )
         if result:
             action = ActionsDbModel(
+                username=user.username,
+                session_id=user.user_session_id,
                 action_status=True,
                 action_type=ActionsEnum.subscribe_channel,
-                action_data={"channel_name": item.username, "channel_id": item.id,
+                action_data={"channel_name": item.username, "channel_id": item.entity_id,
                              "result": result, "subscribe": subscribe_data.subscribe_flag}
             )
             await db.safe_log_action(log_action=action)
             return SubscribeChannelModelResponse(
-                status=StatusEnum.success, channel_id=str(item.id),channel_name=item.username
+                status=StatusEnum.success, channel_id=str(item.entity_id), channel_name=item.username or ""
             )
         else:
             action = ActionsDbModel(
+                username=user.username,
+                session_id=user.user_session_id,
                 action_status=False,
                 action_type=ActionsEnum.subscribe_channel,
-                action_data={"channel_name": item.username, "channel_id": item.id,
+                action_data={"channel_name": item.username, "channel_id": item.entity_id,
                              "result": result, "subscribe": subscribe_data.subscribe_flag}
             )
             await db.safe_log_action(log_action=action)
             return SubscribeChannelModelResponse(
-                status=StatusEnum.failure, channel_id=str(item.id), channel_name=item.username
+                status=StatusEnum.failure, channel_id=str(item.entity_id), channel_name=item.username or ""
             )
+    except SchedulerBusyError as ex:
+        action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
+            action_status=False,
+            action_type=ActionsEnum.subscribe_channel,
+            action_data={"error": f"{ex}"}
+        )
+        await db.safe_log_action(log_action=action)
+        raise __rate_limited(ex)
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=False,
             action_type=ActionsEnum.subscribe_channel,
             action_data={"error": f"{ex}"}
@@ -138,31 +213,52 @@ async def subscribe_channel(subscribe_data: SubscribeChannelModel,
             detail=f"{ex}"
         )
     finally:
-        await account.disconnect()
+        await client_pool.release(session_id=user.user_session_id)
 
 @router.post(path="/users/comment_message", name="users:comment_message", tags=["users"],
              description="Comment channel message with plain text"
              )
 async def comment_message(comment_data: CommentMessageModel,
-                          user: Union[UserDbModel, None] = Depends(get_user)) -> CommentMessageModelResponse:
-    db = AsyncMongoClient()
+                          user: Union[UserDbModel, None] = Depends(get_user),
+                          db: AsyncMongoClient = Depends(get_db),
+                          async_mode: bool = Query(default=False, description=ASYNC_MODE_DESCRIPTION)
+                          ) -> CommentMessageModelResponse:
+    if async_mode or not await session_leases.try_acquire(user.user_session_id):
+        return await __submit_job(wait=not async_mode, db=db, user=user, job_type=ActionsEnum.comment_message,
+                                  payload=comment_data.model_dump(mode="json"))
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
+    account = await client_pool.acquire(session_id=user.user_session_id, session=session)
     try:
-        await account.get_dialogs()
-        channel = await account.get_input_entity(comment_data.channel_id)
-        result = await account.send_message(entity=channel, message=comment_data.comment, comment_to=comment_data.message_id)
+        channel = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                      peer=comment_data.channel_id)
+        result = await scheduler.run(
+            session_id=user.user_session_id, kind=RpcKind.send,
+            operation=lambda: account.send_message(entity=channel, message=comment_data.comment,
+                                                   comment_to=comment_data.message_id)
+        )
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=True,
             action_type=ActionsEnum.comment_message,
-            action_data=result.to_dict()
+            action_data=messages_action_data([result])
         )
         await db.safe_log_action(log_action=action)
         return CommentMessageModelResponse(status=StatusEnum.success)
+    except SchedulerBusyError as ex:
+        action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
+            action_status=False,
+            action_type=ActionsEnum.comment_message,
+            action_data={"error": f"{ex}"}
+        )
+        await db.safe_log_action(log_action=action)
+        raise __rate_limited(ex)
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=False,
             action_type=ActionsEnum.comment_message,
             action_data={"error": f"{ex}"}
@@ -173,30 +269,51 @@ async def comment_message(comment_data: CommentMessageModel,
             detail=f"{ex}"
         )
     finally:
-        await account.disconnect()
+        await client_pool.release(session_id=user.user_session_id)
 
 @router.post(path="/users/like_message", name="users:like_message", tags=["users"],
              description="Like message with emoticon"
              )
-async def like_message(like_data: LikeMessageModel, user: Union[UserDbModel, None] = Depends(get_user)) -> LikeMessageModelResponse:
-    db = AsyncMongoClient()
+async def like_message(like_data: LikeMessageModel, user: Union[UserDbModel, None] = Depends(get_user),
+                       db: AsyncMongoClient = Depends(get_db),
+                       async_mode: bool = Query(default=False, description=ASYNC_MODE_DESCRIPTION)
+                       ) -> LikeMessageModelResponse:
+    if async_mode or not await session_leases.try_acquire(user.user_session_id):
+        return await __submit_job(wait=not async_mode, db=db, user=user, job_type=ActionsEnum.like_message,
+                                  payload=like_data.model_dump(mode="json"))
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
+    account = await client_pool.acquire(session_id=user.user_session_id, session=session)
     try:
-        await account.get_dialogs()
-        item = await account.get_entity(like_data.chat_id)
-        await __sent_reaction(account=account, message_id=like_data.message_id, peer=item, emoticon=like_data.emoticon)
+        item = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                   peer=like_data.chat_id)
+        await scheduler.run(
+            session_id=user.user_session_id, kind=RpcKind.react,
+            operation=lambda: __sent_reaction(account=account, message_id=like_data.message_id, peer=item,
+                                              emoticon=like_data.emoticon)
+        )
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=True,
             action_type=ActionsEnum.like_message,
             action_data={"chat_id": like_data.chat_id, "message_id": like_data.message_id}
         )
         await db.safe_log_action(log_action=action)
         return LikeMessageModelResponse(status=StatusEnum.success)
+    except SchedulerBusyError as ex:
+        action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
+            action_status=False,
+            action_type=ActionsEnum.like_message,
+            action_data={"error": f"{ex}"}
+        )
+        await db.safe_log_action(log_action=action)
+        raise __rate_limited(ex)
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=False,
             action_type=ActionsEnum.like_message,
             action_data={"error": f"{ex}"}
@@ -207,20 +324,23 @@ async def like_message(like_data: LikeMessageModel, user: Union[UserDbModel, Non
             detail=f"{ex}"
         )
     finally:
-        await account.disconnect()
+        await client_pool.release(session_id=user.user_session_id)
 
 @router.post(path="/users/enable_2fa", name="users:enable_2fa", tags=["users"],
              description="Enable/disable/change two-factor authentication"
              )
-async def enable_2fa(twofa_data: TwoFAModel, user: Union[UserDbModel, None] = Depends(get_user)) -> TwoFAModelResponse:
-    db = AsyncMongoClient()
+async def enable_2fa(twofa_data: TwoFAModel, user: Union[UserDbModel, None] = Depends(get_user),
+                     db: AsyncMongoClient = Depends(get_db)) -> TwoFAModelResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        return await __submit_job(wait=True, db=db, user=user, job_type=ActionsEnum.enable_2fa,
+                                  payload=twofa_data.model_dump(mode="json"))
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
+    account = await client_pool.acquire(session_id=user.user_session_id, session=session)
     try:
         result = await account.edit_2fa(current_password=twofa_data.current_password, new_password=twofa_data.new_password)
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=True,
             action_type=ActionsEnum.enable_2fa,
             action_data={"status": result}
@@ -229,6 +349,8 @@ async def enable_2fa(twofa_data: TwoFAModel, user: Union[UserDbModel, None] = De
         return TwoFAModelResponse(status=StatusEnum.success)
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_status=False,
             action_type=ActionsEnum.enable_2fa,
             action_data={"error": f"{ex}"}
@@ -239,27 +361,49 @@ async def enable_2fa(twofa_data: TwoFAModel, user: Union[UserDbModel, None] = De
             detail=f"{ex}"
         )
     finally:
-        await account.disconnect()
+        await client_pool.release(session_id=user.user_session_id)
 
 @router.get(path="/users/history", name="users:history", tags=["users"],
             description="Get history of operators' messages"
             )
-async def get_history(offset: int = 0, limit: int = 10,
-                      user: Union[UserDbModel, None] = Depends(get_user)) -> GetHistoryModelResponse:
-    db = AsyncMongoClient()
+async def get_history(offset: int = Query(default=0, ge=0), limit: int = Query(default=10, ge=1, le=1000),
+                      before: Optional[str] = Query(default=None, description="cursor from previous page, "
+                                                                              "offset is ignored if set"),
+                      sender_username: Optional[str] = Query(default=None, description="only messages of operator"),
+                      recipient_id: Optional[str] = Query(default=None, description="only messages sent to chat"),
+                      created_from: Optional[datetime.datetime] = Query(default=None,
+                                                                        description="messages sent at or after"),
+                      created_to: Optional[datetime.datetime] = Query(default=None, description="messages sent before"),
+                      text: Optional[str] = Query(default=None, min_length=1,
+                                                  description="words of message text, \"quoted\" for a phrase. "
+                                                              "Every match is read to order a page, narrow large "
+                                                              "searches with created_from and created_to"),
+                      user: Union[UserDbModel, None] = Depends(get_user),
+                      db: AsyncMongoClient = Depends(get_db)) -> GetHistoryModelResponse:
+    filters = {"sender_username": sender_username, "recipient_id": recipient_id, "created_from": created_from,
+               "created_to": created_to, "text": text}
     try:
-        result = await db.get_action_history(offset=offset, limit=limit)
+        result, next_cursor = await db.get_action_history(offset=offset, limit=limit, before=before, **filters)
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_type=ActionsEnum.get_history,
-            action_data={"offset": offset, "limit": limit},
+            action_data={"offset": offset, "limit": limit, "before": before, **filters},
             action_status=True
         )
         await db.safe_log_action(log_action=action)
-        return GetHistoryModelResponse(status=StatusEnum.success, data=result)
+        return GetHistoryModelResponse(status=StatusEnum.success, data=result, next_cursor=next_cursor)
+    except InvalidCursorError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{ex}"
+        )
     except Exception as ex:
         action = ActionsDbModel(
+            username=user.username,
+            session_id=user.user_session_id,
             action_type=ActionsEnum.get_history,
-            action_data={"offset": offset, "limit": limit},
+            action_data={"offset": offset, "limit": limit, "before": before, **filters},
             action_status=False
         )
         await db.safe_log_action(log_action=action)
@@ -269,17 +413,406 @@ async def get_history(offset: int = 0, limit: int = 10,
         )
 
 @router.get(path="/users/get_dialogs", name="users:dialogs", tags=["users"],
-            description="Get full information of session dialogs"
+            description="Stream session dialogs as NDJSON, newest first. To get the next page pass date, "
+                        "top_message_id and id of the last dialog as offset_date, offset_id and offset_peer_id"
+            )
+async def get_dialogs(limit: int = Query(default=100, ge=1, le=1000),
+                      offset_date: Union[datetime.datetime, None] = Query(default=None),
+                      offset_id: int = Query(default=0, ge=0),
+                      offset_peer_id: Union[int, None] = Query(default=None),
+                      user: Union[UserDbModel, None] = Depends(get_user),
+                      db: AsyncMongoClient = Depends(get_db)) -> StreamingResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        return await __forward_stream(db=db, user=user, job_type=ActionsEnum.get_dialogs, payload={
+            "limit": limit, "offset_date": offset_date.isoformat() if offset_date is not None else None,
+            "offset_id": offset_id, "offset_peer_id": offset_peer_id
+        })
+    session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
+    async with client_pool.lease(session_id=user.user_session_id, session=session) as account:
+        try:
+            offset_peer = InputPeerEmpty()
+            if offset_peer_id is not None:
+                offset_peer = await entity_cache.get_input_entity(db=db, client=account,
+                                                                  session_id=user.user_session_id,
+                                                                  peer=offset_peer_id)
+        except Exception as ex:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"{ex}"
             )
-async def get_dialogs(user: Union[UserDbModel, None] = Depends(get_user)):
-    db = AsyncMongoClient()
+    return StreamingResponse(
+        __stream_dialogs(db=db, user=user, session=session, limit=limit, offset_date=offset_date,
+                         offset_id=offset_id, offset_peer=offset_peer),
+        media_type="application/x-ndjson",
+        headers=NDJSON_HEADERS
+    )
+
+@router.get(path="/users/get_dialogs_snapshot", name="users:dialogs_snapshot", tags=["users"],
+            description="Get dialogs from snapshot kept by telegram updates. With since=<version> only dialogs "
+                        "changed after that version are returned, oldest change first"
+            )
+async def get_dialogs_snapshot(since: int = Query(default=0, ge=0), limit: int = Query(default=1000, ge=1, le=5000),
+                               user: Union[UserDbModel, None] = Depends(get_user),
+                               db: AsyncMongoClient = Depends(get_db)) -> DialogSnapshotModelResponse:
+    try:
+        state = await db.get_dialog_snapshot_state(session_id=user.user_session_id)
+        synced = state is not None and state.get("synced_at") is not None
+        if not synced:
+            __request_dialog_snapshot_warm(db=db, user=user)
+        # read before the dialogs: everything up to the committed version is written by then
+        version = state.get("committed", 0) if state is not None else 0
+        dialogs = await db.get_dialogs(session_id=user.user_session_id, limit=limit, since=since, until=version)
+        if since > 0 and len(dialogs) == limit:
+            version = dialogs[-1].version
+        return DialogSnapshotModelResponse(
+            status=StatusEnum.success, synced=synced, version=version,
+            data=[DialogSnapshotItemModel(id=dialog.peer_id, **dialog.model_dump(exclude={"session_id", "peer_id"}))
+                  for dialog in dialogs]
+        )
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{ex}"
+        )
+
+@router.post(path="/users/bulk_send_message", name="users:bulk_send_message", tags=["users"],
+             description="Send the same text message with optional files to many chats, "
+                         "per-chat results are streamed as NDJSON"
+             )
+async def bulk_send_message(message: BulkSendMessageModel = Body(), upload_files: List[UploadFile] = None,
+                            user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> StreamingResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        progress = __upload_progress(db=db, user=user, upload_id=message.upload_id, upload_files=upload_files)
+        if progress is not None:
+            await progress.start()
+        return await __forward_stream(db=db, user=user, job_type=ActionsEnum.bulk_send_message,
+                                      payload=message.model_dump(mode="json"), upload_files=upload_files)
+    session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
+    async with client_pool.lease(session_id=user.user_session_id, session=session) as account:
+        try:
+            prepared = None
+            if upload_files is not None:
+                progress = __upload_progress(db=db, user=user, upload_id=message.upload_id,
+                                             upload_files=upload_files)
+                prepared = await media_cache.prepare(db=db, session_id=user.user_session_id,
+                                                     upload_files=upload_files, progress=progress)
+                # request files are closed once the response starts streaming
+                await media_cache.upload(client=account, prepared=prepared)
+        except Exception as ex:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"{ex}"
+            )
+
+    async def send_one(account: TelegramClient, chat_id: int) -> Tuple[dict, dict, List[MessageDbModel]]:
+        item = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                   peer=chat_id)
+        if prepared is not None:
+            caption = ["" for _ in upload_files]
+            caption[-1] = message.text_message
+            result = await media_cache.send(db=db, client=account, prepared=prepared, send=lambda files: scheduler.run(
+                session_id=user.user_session_id, kind=RpcKind.send,
+                operation=lambda: account.send_file(entity=item, caption=caption, file=files)
+            ))
+        else:
+            result = [await scheduler.run(
+                session_id=user.user_session_id, kind=RpcKind.send,
+                operation=lambda: account.send_message(entity=item, message=message.text_message)
+            )]
+        messages = [__get_data_from_message_object(message=item_message, if_channel=message.if_channel,
+                                                   sender_username=user.username) for item_message in result]
+        return {"chat_id": chat_id, "message_id": [item_message.id for item_message in result]}, \
+            messages_action_data(result), messages
+
+    return StreamingResponse(
+        __stream_bulk_results(db=db, user=user, session=session, action_type=ActionsEnum.send_message,
+                              targets=message.chat_ids, operation=send_one),
+        media_type="application/x-ndjson",
+        headers=NDJSON_HEADERS
+    )
+
+@router.post(path="/users/bulk_like_message", name="users:bulk_like_message", tags=["users"],
+             description="Like many messages with emoticon, per-message results are streamed as NDJSON"
+             )
+async def bulk_like_message(like_data: BulkLikeMessageModel, user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> StreamingResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        return await __forward_stream(db=db, user=user, job_type=ActionsEnum.bulk_like_message,
+                                      payload=like_data.model_dump(mode="json"))
+    session = await __leasable_session(db=db, user=user)
+
+    async def like_one(account: TelegramClient, target) -> Tuple[dict, dict, List[MessageDbModel]]:
+        item = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                   peer=target.chat_id)
+        await scheduler.run(
+            session_id=user.user_session_id, kind=RpcKind.react,
+            operation=lambda: __sent_reaction(account=account, message_id=target.message_id, peer=item,
+                                              emoticon=like_data.emoticon)
+        )
+        data = {"chat_id": target.chat_id, "message_id": target.message_id}
+        return data, data, []
+
+    return StreamingResponse(
+        __stream_bulk_results(db=db, user=user, session=session, action_type=ActionsEnum.like_message,
+                              targets=like_data.targets, operation=like_one),
+        media_type="application/x-ndjson",
+        headers=NDJSON_HEADERS
+    )
+
+@router.post(path="/users/bulk_comment_message", name="users:bulk_comment_message", tags=["users"],
+             description="Comment many channel messages with plain text, per-message results are streamed as NDJSON"
+             )
+async def bulk_comment_message(comment_data: BulkCommentMessageModel,
+                               user: Union[UserDbModel, None] = Depends(get_user),
+                               db: AsyncMongoClient = Depends(get_db)) -> StreamingResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        return await __forward_stream(db=db, user=user, job_type=ActionsEnum.bulk_comment_message,
+                                      payload=comment_data.model_dump(mode="json"))
+    session = await __leasable_session(db=db, user=user)
+
+    async def comment_one(account: TelegramClient, target) -> Tuple[dict, dict, List[MessageDbModel]]:
+        channel = await entity_cache.get_input_entity(db=db, client=account, session_id=user.user_session_id,
+                                                      peer=target.channel_id)
+        result = await scheduler.run(
+            session_id=user.user_session_id, kind=RpcKind.send,
+            operation=lambda: account.send_message(entity=channel, message=comment_data.comment,
+                                                   comment_to=target.message_id)
+        )
+        return {"channel_id": target.channel_id, "message_id": result.id}, messages_action_data([result]), []
+
+    return StreamingResponse(
+        __stream_bulk_results(db=db, user=user, session=session, action_type=ActionsEnum.comment_message,
+                              targets=comment_data.targets, operation=comment_one),
+        media_type="application/x-ndjson",
+        headers=NDJSON_HEADERS
+    )
+
+async def __leasable_session(db: AsyncMongoClient, user: UserDbModel) -> SessionDbModel:
+    # connect before the response starts, so an unusable session is still reported with its status code
     session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
-    account = await TelegramAccount(session_file_name=session.session_file_name,
-                                    app_id=session.telegram_api_id,
-                                    app_hash=session.telegram_api_hash).get_client()
-    dialogs_data = str(await account.get_dialogs())
-    await account.disconnect()
-    return dialogs_data
+    async with client_pool.lease(session_id=user.user_session_id, session=session):
+        return session
+
+async def __stream_bulk_results(db: AsyncMongoClient, user: UserDbModel, session: SessionDbModel,
+                                action_type: ActionsEnum, targets: list,
+                                operation: Callable[..., Awaitable[Tuple[dict, dict, List[MessageDbModel]]]]
+                                ) -> AsyncIterator[str]:
+    # the client is leased here and not by the endpoint: a generator that never starts has nothing to release
+    try:
+        account = await client_pool.acquire(session_id=user.user_session_id, session=session)
+    except Exception as ex:
+        yield json.dumps({"error": f"{ex}"}) + "\n"
+        return
+    semaphore = asyncio.Semaphore(settings.BULK_CONCURRENCY)
+    actions: List[ActionsDbModel] = []
+    messages: List[MessageDbModel] = []
+
+    async def run(index: int, target) -> BulkItemResultModel:
+        async with semaphore:
+            try:
+                data, action_data, item_messages = await operation(account, target)
+                actions.append(ActionsDbModel(username=user.username, session_id=user.user_session_id,
+                                              action_status=True, action_type=action_type, action_data=action_data))
+                messages.extend(item_messages)
+                return BulkItemResultModel(index=index, status=StatusEnum.success, data=data)
+            except Exception as ex:
+                actions.append(ActionsDbModel(username=user.username, session_id=user.user_session_id,
+                                              action_status=False, action_type=action_type,
+                                              action_data={"error": f"{ex}"}))
+                data = {"error": f"{ex}"}
+                if isinstance(ex, SchedulerBusyError):
+                    data["retry_after"] = ex.retry_after
+                return BulkItemResultModel(index=index, status=StatusEnum.failure, data=data)
+
+    tasks = [asyncio.ensure_future(run(index, target)) for index, target in enumerate(targets)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            yield result.model_dump_json() + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        await db.safe_audit_batch(actions=actions, messages=messages)
+        await client_pool.release(session_id=user.user_session_id)
+
+async def __stream_dialogs(db: AsyncMongoClient, user: UserDbModel, session: SessionDbModel, limit: int,
+                           offset_date: Union[datetime.datetime, None], offset_id: int,
+                           offset_peer: TypeInputPeer) -> AsyncIterator[str]:
+    try:
+        account = await client_pool.acquire(session_id=user.user_session_id, session=session)
+    except Exception as ex:
+        yield json.dumps({"error": f"{ex}"}) + "\n"
+        return
+    entities: List[EntityDbModel] = []
+    try:
+        async for dialog in account.iter_dialogs(limit=limit, offset_date=offset_date, offset_id=offset_id,
+                                                 offset_peer=offset_peer):
+            entity = entity_to_db_model(session_id=user.user_session_id, entity=dialog.entity)
+            if entity is None:
+                continue
+            entities.append(entity)
+            yield DialogModel(
+                id=dialog.id,
+                title=dialog.title or "",
+                type=entity.peer_type,
+                unread_count=dialog.unread_count,
+                date=dialog.date,
+                top_message_id=dialog.message.id if dialog.message is not None else 0
+            ).model_dump_json() + "\n"
+            if len(entities) >= DIALOGS_BATCH_SIZE:
+                await db.save_cached_entities(entities)
+                entities = []
+    except Exception as ex:
+        yield json.dumps({"error": f"{ex}"}) + "\n"
+    finally:
+        try:
+            await db.save_cached_entities(entities)
+        finally:
+            await client_pool.release(session_id=user.user_session_id)
+
+def __request_dialog_snapshot_warm(db: AsyncMongoClient, user: UserDbModel):
+    if user.user_session_id not in __warm_tasks:
+        __warm_tasks[user.user_session_id] = asyncio.create_task(__warm_dialog_snapshot(db=db, user=user))
+
+async def __warm_dialog_snapshot(db: AsyncMongoClient, user: UserDbModel):
+    try:
+        session = SessionDbModel.model_validate(await db.get_session_by_id(user.user_session_id))
+        async with client_pool.lease(session_id=user.user_session_id, session=session) as account:
+            await dialog_snapshot.request_sync(session_id=user.user_session_id, client=account)
+    except Exception:
+        pass
+    finally:
+        __warm_tasks.pop(user.user_session_id, None)
+
+@router.get(path="/users/uploads/{upload_id}", name="users:upload_progress", tags=["users"],
+            description="Get per-file progress of files sent with upload_id: bytes and parts saved, retries, status"
+            )
+async def get_upload_progress(upload_id: str, user: Union[UserDbModel, None] = Depends(get_user),
+                              db: AsyncMongoClient = Depends(get_db)) -> UploadProgressModelResponse:
+    try:
+        progress = await db.get_upload_progress(username=user.username, upload_id=upload_id)
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{ex}"
+        )
+    if progress is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="upload not found"
+        )
+    return UploadProgressModelResponse(status=StatusEnum.success, data=progress)
+
+@router.get(path="/users/rate_limit_status", name="users:rate_limit_status", tags=["users"],
+            description="Get queue depth and expected wait (seconds) for send, react and join operations of session"
+            )
+async def rate_limit_status(user: Union[UserDbModel, None] = Depends(get_user),
+                            db: AsyncMongoClient = Depends(get_db)) -> RateLimitStatusModelResponse:
+    if not await session_leases.try_acquire(user.user_session_id):
+        # the queues live in the scheduler of the worker that owns the session
+        return await __submit_job(wait=True, db=db, user=user, job_type=ActionsEnum.rate_limit_status, payload={})
+    return RateLimitStatusModelResponse(status=StatusEnum.success,
+                                        data=scheduler.status(session_id=user.user_session_id))
+
+async def __submit_job(db: AsyncMongoClient, user: UserDbModel, job_type: ActionsEnum, payload: dict,
+                       upload_files: Union[List[UploadFile], None] = None, wait: bool = False) -> JSONResponse:
+    job_id = ObjectId()
+    # subscribed before the job exists, so its finished event cannot be missed
+    events = job_events.subscribe(job_id) if wait else None
+    try:
+        await __create_job(db=db, user=user, job_id=job_id, job_type=job_type, payload=payload,
+                           upload_files=upload_files)
+        if wait:
+            deadline = asyncio.get_running_loop().time() + settings.SESSION_FORWARD_TIMEOUT
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(),
+                                                   timeout=max(deadline - asyncio.get_running_loop().time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if event["event"] == JobEventEnum.finished:
+                    break
+            job = await db.get_job(job_id=str(job_id))
+            if job["status"] == JobStatusEnum.succeeded:
+                return JSONResponse(content=job["result"])
+            if job["status"] == JobStatusEnum.failed:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=job["error"]
+                )
+    finally:
+        job_events.unsubscribe(job_id)
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED,
+                        content=JobSubmittedModelResponse(status=StatusEnum.success, job_id=str(job_id)).model_dump())
+
+async def __forward_stream(db: AsyncMongoClient, user: UserDbModel, job_type: ActionsEnum, payload: dict,
+                           upload_files: Union[List[UploadFile], None] = None) -> StreamingResponse:
+    job_id = ObjectId()
+    await __create_job(db=db, user=user, job_id=job_id, job_type=job_type, payload=payload, upload_files=upload_files)
+    return StreamingResponse(__stream_job_output(db=db, job_id=job_id), media_type="application/x-ndjson",
+                             headers=NDJSON_HEADERS)
+
+async def __create_job(db: AsyncMongoClient, user: UserDbModel, job_id: ObjectId, job_type: ActionsEnum,
+                       payload: dict, upload_files: Union[List[UploadFile], None]):
+    files = []
+    try:
+        for upload_file in upload_files or []:
+            file_id, size = await db.save_job_file(job_id=job_id, filename=upload_file.filename,
+                                                   chunks=upload_chunks(upload_file))
+            files.append(JobFileModel(file_id=file_id, filename=upload_file.filename, size=size))
+        await db.create_job(job_id=job_id, job=JobDbModel(job_type=job_type, username=user.username,
+                                                          session_id=user.user_session_id, payload=payload,
+                                                          files=files))
+    except Exception:
+        if files:
+            await db.delete_job_files(job_id=job_id)
+        raise
+    await job_events.publish(job_id=job_id, event=JobEventEnum.queued)
+
+async def __stream_job_output(db: AsyncMongoClient, job_id: ObjectId) -> AsyncIterator[str]:
+    # lines of the job are relayed as the owner of the session produces them; subscribed here and not by the
+    # endpoint, a generator that never starts has nothing to unsubscribe. Missed events are filled in from the
+    # result once the job has finished.
+    events = job_events.subscribe(job_id)
+    sent = set()
+    try:
+        job = await db.get_job(job_id=str(job_id))
+        while job["status"] not in (JobStatusEnum.succeeded, JobStatusEnum.failed):
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=settings.SESSION_FORWARD_TIMEOUT)
+            except asyncio.TimeoutError:
+                job = await db.get_job(job_id=str(job_id))
+                if job["status"] in (JobStatusEnum.succeeded, JobStatusEnum.failed):
+                    break
+                yield json.dumps({"job_id": str(job_id),
+                                  "error": f"job is {job['status']}, get its result at /users/jobs/{job_id}"}) + "\n"
+                return
+            if event["event"] == JobEventEnum.output and event["index"] not in sent:
+                sent.add(event["index"])
+                yield event["line"]
+            elif event["event"] == JobEventEnum.finished:
+                job = await db.get_job(job_id=str(job_id))
+        for index, line in enumerate(job["result"].get("lines", [])):
+            if index not in sent:
+                yield line
+        if job["status"] == JobStatusEnum.failed:
+            yield json.dumps({"error": job["error"]}) + "\n"
+    finally:
+        job_events.unsubscribe(job_id)
+
+def __upload_progress(db: AsyncMongoClient, user: UserDbModel, upload_id: Union[str, None],
+                      upload_files: Union[List[UploadFile], None]) -> Union[UploadProgress, None]:
+    if upload_id is None or upload_files is None:
+        return None
+    return UploadProgress(db=db, username=user.username, upload_id=upload_id, upload_files=upload_files)
+
+def __rate_limited(ex: SchedulerBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"{ex}",
+        headers={"Retry-After": f"{math.ceil(ex.retry_after)}"}
+    )
 
 async def __subscribe_channel(account: TelegramClient, channel: InputChannel, subscribe: bool) -> bool:
     if subscribe:
@@ -0,0 +1,62 @@
+import argparse
+import datetime
+import random
+from typing import List
+
+import bson
+from telethon.tl import types
+
+from database.models import ActionsDbModel, ActionsEnum
+from telegram.action_data import compact_message, compress_raw, decompress_raw
+
+
+def make_message(index: int, text_size: int) -> types.Message:
+    document = types.Document(
+        id=random.getrandbits(63), access_hash=random.getrandbits(63), file_reference=random.randbytes(24),
+        date=datetime.datetime.now(datetime.timezone.utc), mime_type="video/mp4", size=random.randint(1, 10 ** 8),
+        dc_id=2,
+        attributes=[types.DocumentAttributeVideo(duration=31.5, w=1280, h=720, supports_streaming=True),
+                    types.DocumentAttributeFilename(file_name=f"video_{index}.mp4")],
+        thumbs=[types.PhotoStrippedSize(type="i", bytes=random.randbytes(180)),
+                types.PhotoSize(type="m", w=320, h=180, size=12000)]
+    )
+    return types.Message(
+        id=1000 + index, peer_id=types.PeerChannel(channel_id=1234567890), date=datetime.datetime.now(),
+        message="benchmark " * (text_size // 10), out=True, from_id=types.PeerUser(user_id=987654321),
+        media=types.MessageMediaDocument(document=document), grouped_id=13579,
+        entities=[types.MessageEntityBold(offset=0, length=9), types.MessageEntityUrl(offset=10, length=19)],
+        replies=types.MessageReplies(replies=0, replies_pts=1, comments=True)
+    )
+
+
+def action_size(action_data: dict) -> int:
+    return len(bson.encode(ActionsDbModel(action_type=ActionsEnum.send_message, action_data=action_data,
+                                          action_status=True).model_dump()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BSON bytes per send_message action: full telethon dicts vs compact")
+    parser.add_argument("--files", type=int, nargs="+", default=[0, 1, 5, 10], help="files per message, 0 is text")
+    parser.add_argument("--text-size", type=int, default=200)
+    args = parser.parse_args()
+    for files in args.files:
+        messages: List[types.Message] = [make_message(index, args.text_size) for index in range(max(files, 1))]
+        if files == 0:
+            messages[0].media, messages[0].grouped_id = None, None
+        if files == 0:
+            full = messages[0].to_dict()
+        else:
+            full = {f"{i}": message.to_dict() for i, message in enumerate(messages)}
+        compact = {"messages": [compact_message(message) for message in messages]}
+        raw = compress_raw([message.to_dict() for message in messages])
+        assert len(decompress_raw(raw)) == len(messages)
+        print({
+            "files": files,
+            "full_bytes": action_size(full),
+            "compact_bytes": action_size(compact),
+            "compact_with_raw_bytes": action_size({**compact, "raw": raw}),
+        })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import dataclasses
+import subprocess
+import sys
+import time
+from typing import List
+
+import httpx
+
+import main
+from benchmarks.fake_telegram import FakeTelegramClient, FakeTelegramProfile
+from benchmarks.load_test import in_memory_mongo, seed, percentile, VirtualUser
+from database.database import AsyncMongoClient, mongo_connection
+from database.models import SessionDbModel
+from telegram.client_pool import client_pool
+from telegram.warm_start import warm_start
+
+READY_POLL_INTERVAL = 0.01
+
+
+async def run_mode(mode: str, args):
+    profile = FakeTelegramProfile(rpc_latency=args.rpc_latency_ms / 1000, rpc_jitter=0.0,
+                                  connect_latency=args.connect_ms / 1000, seed=args.seed)
+
+    async def fake_client_factory(session_id: str, session: SessionDbModel) -> FakeTelegramClient:
+        client = FakeTelegramClient(profile=dataclasses.replace(profile))
+        await client.connect()
+        return client
+
+    client_pool.client_factory = fake_client_factory
+    warm_start.enabled = mode == "warm"
+    warm_start.concurrency = args.concurrency
+    motor_client = in_memory_mongo()
+    mongo_connection.client = motor_client
+    usernames = await seed(AsyncMongoClient(client=motor_client), operators=args.operators)
+    start = time.perf_counter()
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+            while (await http.get("/health/ready")).status_code != 200:
+                await asyncio.sleep(READY_POLL_INTERVAL)
+            time_to_ready = time.perf_counter() - start
+            users = [VirtualUser(http=http, username=username, file_count=0, file_bytes=b"") for username in usernames]
+            await asyncio.gather(*[user.login() for user in users])
+
+            async def first_send(user: VirtualUser) -> float:
+                request_start = time.perf_counter()
+                response = await user.send_message()
+                assert response.status_code == 200, response.text
+                return time.perf_counter() - request_start
+
+            latencies: List[float] = sorted(await asyncio.gather(*[first_send(user) for user in users]))
+    print({
+        "mode": mode,
+        "operators": args.operators,
+        "seconds_to_ready": round(time_to_ready, 2),
+        "first_send_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "first_send_max_ms": round(latencies[-1] * 1000, 1),
+        "warm_start": {key: warm_start.stats()[key] for key in ("sessions", "connected", "failed")},
+    })
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Time to ready and first send_message latency per operator "
+                                                 "with and without warm start, against the fake telegram backend")
+    parser.add_argument("--mode", choices=["cold", "warm"], default=None)
+    parser.add_argument("--operators", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions pre-connected at once")
+    parser.add_argument("--connect-ms", type=float, default=500, help="telegram connect and handshake time")
+    parser.add_argument("--rpc-latency-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.mode is not None:
+        asyncio.run(run_mode(mode=args.mode, args=args))
+        return
+    for mode in ("cold", "warm"):
+        subprocess.run([sys.executable, "-m", "benchmarks.cold_start", "--mode", mode,
+                        "--operators", str(args.operators), "--concurrency", str(args.concurrency),
+                        "--connect-ms", str(args.connect_ms), "--rpc-latency-ms", str(args.rpc_latency_ms),
+                        "--seed", str(args.seed)], check=True)
+
+
+if __name__ == "__main__":
+    main_cli()
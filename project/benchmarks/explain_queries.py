@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import datetime
+import functools
+import io
+import sys
+from typing import List, Tuple, Callable, Awaitable, Set, Union
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import monitoring
+
+from api.api_models import AdminInsertUserModel, AdminUpdateUserModel, AdminBulkUserModel
+from config import get_settings
+from database.database import AsyncMongoClient, JOB_FILES_BUCKET
+from database.models import (SessionDbModel, EntityDbModel, PeerTypeEnum, JobDbModel, JobStatusEnum, ActionsEnum,
+                             MessageDbModel, ActionsDbModel, DialogDbModel, RollupGranularityEnum, RollupGroupEnum,
+                             CachedMediaDbModel, CachedMediaTypeEnum, UploadProgressDbModel, UploadFileProgressModel,
+                             UploadStatusEnum, JobEventEnum)
+
+settings = get_settings()
+
+WORKER = "explain:1"
+NO_QUERY_METHODS = {"create_indexes", "add_user_by_admin", "add_new_session", "create_job", "safe_message",
+                    "safe_log_action", "safe_audit_batch", "insert_audit_records", "ping", "save_job_file",
+                    "publish_job_event"}
+# the capped job_events collection is read from its end in insertion order, a scan that stops at the first document
+NATURAL_ORDER_METHODS = {"get_last_job_event_id"}
+# sent by the driver with every command, explain takes the query alone
+DRIVER_FIELDS = {"lsid", "txnNumber", "writeConcern", "readConcern"}
+
+RecordedQuery = Tuple[str, str, Callable[[], Awaitable[dict]]]
+
+
+def calling_method() -> str:
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == "database.database" and "self" in frame.f_locals:
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return "unknown"
+
+
+class RecordingCollection:
+
+    def __init__(self, collection: AsyncIOMotorCollection, queries: List[RecordedQuery]):
+        self.__collection = collection
+        self.__queries = queries
+
+    def __getattr__(self, name):
+        return getattr(self.__collection, name)
+
+    def find(self, *args, **kwargs):
+        cursor = self.__collection.find(*args, **kwargs)
+        if "cursor_type" in kwargs:
+            # a tailable cursor is explained as the plain find it starts with
+            plain = {name: value for name, value in kwargs.items() if name != "cursor_type"}
+            self.__record(lambda: self.__collection.find(*args, **plain).explain())
+        else:
+            self.__record(lambda: cursor.clone().explain())
+        return cursor
+
+    def find_one(self, filter=None, *args, **kwargs):
+        filter = filter if isinstance(filter, dict) or filter is None else {"_id": filter}
+        self.__record(lambda: self.__collection.find(filter).limit(1).explain())
+        return self.__collection.find_one(filter, *args, **kwargs)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        self.__record_command({"update": self.name, "updates": [{"q": filter, "u": update, "upsert": upsert}]})
+        return self.__collection.update_one(filter, update, upsert=upsert, **kwargs)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        self.__record_command({"update": self.name,
+                               "updates": [{"q": filter, "u": update, "upsert": upsert, "multi": True}]})
+        return self.__collection.update_many(filter, update, upsert=upsert, **kwargs)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        self.__record_command({"update": self.name, "updates": [{"q": filter, "u": replacement, "upsert": upsert}]})
+        return self.__collection.replace_one(filter, replacement, upsert=upsert, **kwargs)
+
+    def delete_one(self, filter, **kwargs):
+        self.__record_command({"delete": self.name, "deletes": [{"q": filter, "limit": 1}]})
+        return self.__collection.delete_one(filter, **kwargs)
+
+    def delete_many(self, filter, **kwargs):
+        self.__record_command({"delete": self.name, "deletes": [{"q": filter, "limit": 0}]})
+        return self.__collection.delete_many(filter, **kwargs)
+
+    def find_one_and_update(self, filter, update, sort=None, **kwargs):
+        self.__record_command({"findAndModify": self.name, "query": filter, "update": update,
+                               "sort": dict(sort or [])})
+        return self.__collection.find_one_and_update(filter, update, sort=sort, **kwargs)
+
+    def count_documents(self, filter, **kwargs):
+        self.__record_command({"count": self.name, "query": filter})
+        return self.__collection.count_documents(filter, **kwargs)
+
+    def bulk_write(self, requests, **kwargs):
+        for request in requests:
+            self.__record_command({"update": self.name, "updates": [
+                {"q": request._filter, "u": request._doc, "upsert": request._upsert}
+            ]})
+        return self.__collection.bulk_write(requests, **kwargs)
+
+    def __record_command(self, command: dict):
+        database = self.__collection.database
+        self.__record(lambda: database.command("explain", command, verbosity="queryPlanner"))
+
+    def __record(self, explain: Callable[[], Awaitable[dict]]):
+        self.__queries.append((calling_method(), self.name, explain))
+
+
+class RecordingDatabase(AsyncIOMotorDatabase):
+    """A motor database, so command, create_collection and GridFS buckets work on it, whose collections record."""
+
+    def __init__(self, client: AsyncIOMotorClient, name: str, queries: List[RecordedQuery]):
+        super().__init__(client, name)
+        self.__queries = queries
+
+    def __getitem__(self, name) -> RecordingCollection:
+        return RecordingCollection(super().__getitem__(name), self.__queries)
+
+
+class GridFSListener(monitoring.CommandListener):
+    """GridFS queries its files and chunks through pymongo on an executor thread, past the recording collections
+    and out of reach of calling_method(): its commands are recorded for the method that runs at the time."""
+
+    def __init__(self, queries: List[RecordedQuery]):
+        self.queries = queries
+        self.method = "unknown"
+        self.database: Union[AsyncIOMotorDatabase, None] = None
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        if self.database is None or event.database_name != self.database.name or \
+                event.command_name not in ("find", "delete") or \
+                not isinstance(collection, str) or not collection.startswith(f"{JOB_FILES_BUCKET}."):
+            return
+        command = {name: value for name, value in event.command.items()
+                   if name not in DRIVER_FIELDS and not name.startswith("$")}
+        if event.command_name == "find" and not command.get("filter"):
+            # the emptiness check gridfs runs before it creates its indexes
+            return
+        database = self.database
+        self.queries.append((self.method, collection,
+                             lambda: database.command("explain", command, verbosity="queryPlanner")))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class RecordingClient:
+
+    def __init__(self, client: AsyncIOMotorClient, database_name: str, gridfs_listener: GridFSListener):
+        self.queries = gridfs_listener.queries
+        self.telegram_db = RecordingDatabase(client, database_name, self.queries)
+        gridfs_listener.database = self.telegram_db
+
+
+def track_methods(db: AsyncMongoClient, gridfs_listener: GridFSListener):
+    for name, value in vars(AsyncMongoClient).items():
+        if asyncio.iscoroutinefunction(value) and not name.startswith("_"):
+            setattr(db, name, tracked(getattr(db, name), name=name, gridfs_listener=gridfs_listener))
+
+
+def tracked(method, name: str, gridfs_listener: GridFSListener):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        outer, gridfs_listener.method = gridfs_listener.method, name
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            gridfs_listener.method = outer
+    return wrapper
+
+
+def plan_stages(plan) -> Set[str]:
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+
+async def explain_chunks():
+    yield b"explain"
+
+
+async def exercise(db: AsyncMongoClient):
+    await db.create_indexes()
+    await db.create_admin()
+    await db.add_user_by_admin(AdminInsertUserModel(new_username="operator", new_user_password="password",
+                                                    new_user_session_id="", new_user_description="explain"))
+    await db.ping()
+    await db.get_user_by_login(username="operator")
+    await db.get_all_users_by_admin()
+    await db.update_user_by_admin(username="operator",
+                                  user_new_data=AdminUpdateUserModel(updated_user_description="explained"))
+    await db.get_users_version()
+    await db.bump_users_version("operator")
+    await db.bulk_upsert_users_by_admin([AdminBulkUserModel(username="operator", active=True)])
+    await db.get_operator_session_ids(limit=1)
+    session_id = await db.add_new_session(SessionDbModel(session_file_name="explain.session",
+                                                         telegram_api_id=1, telegram_api_hash="explain"))
+    await db.get_all_sessions_by_admin()
+    await db.get_session_by_id(session_id)
+    await db.save_telethon_session(session_id=session_id, state={"dc_id": 2})
+    await db.get_telethon_session(session_id=session_id)
+    await db.save_cached_entities([EntityDbModel(session_id=session_id, peer_id=1, entity_id=1,
+                                                 peer_type=PeerTypeEnum.user, access_hash=1, username="explain")])
+    await db.get_session_entities(session_id=session_id)
+    await db.get_cached_entity(session_id=session_id, peer_id=1)
+    await db.get_cached_entity(session_id=session_id, username="explain")
+    await db.save_cached_media([CachedMediaDbModel(session_id=session_id, sha256="explain",
+                                                   media_type=CachedMediaTypeEnum.document, media_id=1, access_hash=1,
+                                                   file_reference=b"explain", size=1)])
+    await db.get_cached_media(session_id=session_id, digests=["explain"])
+    await db.delete_cached_media(session_id=session_id, digests=["explain"])
+    await db.save_upload_progress(UploadProgressDbModel(username="operator", upload_id="explain",
+                                                        files=[UploadFileProgressModel(size=1)],
+                                                        expires_at=datetime.datetime.now()))
+    await db.update_upload_file_progress(username="operator", upload_id="explain", index=0,
+                                         file=UploadFileProgressModel(size=1, uploaded_bytes=1,
+                                                                      status=UploadStatusEnum.done))
+    await db.get_upload_progress(username="operator", upload_id="explain")
+    await db.safe_message(MessageDbModel(message_id=1, message_text="explain", sender_username="operator",
+                                         recipient_id="1"))
+    await db.safe_log_action(ActionsDbModel(username="operator", session_id="explain",
+                                            action_type=ActionsEnum.send_message, action_data={}, action_status=True))
+    await db.update_action_rollups([ActionsDbModel(username="operator", session_id="explain",
+                                                   action_type=ActionsEnum.like_message, action_data={},
+                                                   action_status=False).model_dump()])
+    for group_by in RollupGroupEnum:
+        await db.get_action_rollups(granularity=RollupGranularityEnum.hour, start=datetime.datetime.now(),
+                                    end=datetime.datetime.now(), group_by=group_by)
+    await db.get_action_rollups(granularity=RollupGranularityEnum.day, start=datetime.datetime.now(),
+                                end=datetime.datetime.now(), group_by=RollupGroupEnum.username, username="operator")
+    await db.get_action_rollups(granularity=RollupGranularityEnum.minute, start=datetime.datetime.now(),
+                                end=datetime.datetime.now(), group_by=RollupGroupEnum.session_id,
+                                session_id="explain")
+    _, cursor = await db.get_action_history(limit=1)
+    await db.get_action_history(limit=1, offset=1)
+    await db.get_action_history(limit=1, before=cursor or f"{datetime.datetime.now().isoformat()},{ObjectId()}")
+    await db.get_action_history(limit=1, sender_username="operator",
+                                created_from=datetime.datetime.now() - datetime.timedelta(days=1))
+    await db.get_action_history(limit=1, recipient_id="1", created_to=datetime.datetime.now(),
+                                before=f"{datetime.datetime.now().isoformat()},{ObjectId()}")
+    await db.get_action_history(limit=1, text="explain")
+    await db.get_action_history(limit=1, sender_username="operator", text="\"explain\"")
+    await db.get_action_history(limit=1, text="explain",
+                                created_from=datetime.datetime.now() - datetime.timedelta(days=1),
+                                before=f"{datetime.datetime.now().isoformat()},{ObjectId()}")
+    job_id = ObjectId()
+    await db.create_job(job_id=job_id, job=JobDbModel(job_type=ActionsEnum.send_message, username="operator",
+                                                      session_id=session_id, payload={}))
+    await db.claim_job(owner=WORKER, lease_seconds=60, excluded_sessions=["foreign"])
+    await db.renew_job_lease(job_id=job_id, owner=WORKER, lease_seconds=60)
+    await db.requeue_job(job_id=job_id, not_before=datetime.datetime.now())
+    await db.finish_job(job_id=job_id, job_status=JobStatusEnum.succeeded)
+    await db.get_job(job_id=str(job_id))
+    file_id, _ = await db.save_job_file(job_id=job_id, filename="explain.txt", chunks=explain_chunks())
+    await db.download_job_file(file_id=file_id, destination=io.BytesIO())
+    await db.delete_job_files(job_id=job_id)
+    await db.publish_job_event(job_id=job_id, event=JobEventEnum.finished)
+    await db.tail_job_events(after=await db.get_last_job_event_id()).close()
+    for username in ("operator", None):
+        for job_status in (JobStatusEnum.succeeded, None):
+            await db.get_jobs(username=username, job_status=job_status, limit=1)
+            await db.get_jobs(username=username, job_status=job_status, limit=1,
+                              before=f"{datetime.datetime.now().isoformat()},{job_id}")
+    await db.acquire_session_lease(session_id=session_id, owner=WORKER, lease_seconds=60)
+    await db.renew_session_leases(session_ids=[session_id], owner=WORKER, lease_seconds=60)
+    await db.get_session_lease(session_id=session_id)
+    await db.get_foreign_session_leases(owner=WORKER)
+    await db.release_session_lease(session_id=session_id, owner=WORKER)
+    version = await db.allocate_dialog_versions(session_id=session_id)
+    await db.save_dialogs([DialogDbModel(session_id=session_id, peer_id=1, title="explain", type=PeerTypeEnum.user,
+                                         version=version)])
+    await db.update_dialog(session_id=session_id, peer_id=1, version=version, changes={"unread_count": 0},
+                           max_read_id=1)
+    await db.commit_dialog_versions(session_id=session_id, version=version)
+    await db.mark_dialog_snapshot_synced(session_id=session_id)
+    await db.mark_dialog_snapshot_stale(session_id=session_id)
+    await db.get_dialog_snapshot_state(session_id=session_id)
+    await db.get_dialogs(session_id=session_id, limit=1)
+    await db.get_dialogs(session_id=session_id, limit=1, since=version - 1, until=version)
+    await db.delete_session_by_admin(session_id=session_id)
+    await db.delete_user_by_admin(username="operator")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Explain every AsyncMongoClient query and fail on COLLSCAN")
+    parser.add_argument("--mongo-uri", default=settings.MONGO_URI)
+    parser.add_argument("--database", default="telegram_db_explain",
+                        help="scratch database, dropped after the run")
+    args = parser.parse_args()
+
+    gridfs_listener = GridFSListener(queries=[])
+    motor_client = AsyncIOMotorClient(args.mongo_uri, event_listeners=[gridfs_listener])
+    client = RecordingClient(client=motor_client, database_name=args.database, gridfs_listener=gridfs_listener)
+    db = AsyncMongoClient(client=client)
+    track_methods(db, gridfs_listener=gridfs_listener)
+    failures = []
+    try:
+        await exercise(db)
+        for method, collection, explain in client.queries:
+            stages = plan_stages((await explain()).get("queryPlanner", {}))
+            collscan = "COLLSCAN" in stages and method not in NATURAL_ORDER_METHODS
+            if collscan:
+                failures.append(f"{method}: COLLSCAN on {collection}")
+            print(f"{'FAIL' if collscan else 'ok  '} {method:<28} {collection:<16} {','.join(sorted(stages))}")
+        methods = {name for name, value in vars(AsyncMongoClient).items()
+                   if asyncio.iscoroutinefunction(value) and not name.startswith("_")}
+        for method in sorted(methods - NO_QUERY_METHODS - {query[0] for query in client.queries}):
+            failures.append(f"{method}: not exercised, add it to exercise()")
+    finally:
+        await motor_client.drop_database(args.database)
+        motor_client.close()
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from telethon import utils
+from telethon.errors import FloodWaitError, FileReferenceExpiredError, FileReferenceInvalidError
+from telethon.sessions import StringSession
+from telethon.tl import types
+from telethon.tl.functions.channels import JoinChannelRequest, LeaveChannelRequest
+from telethon.tl.functions.messages import (SendMessageRequest, SendMediaRequest, SendMultiMediaRequest,
+                                            UploadMediaRequest, SendReactionRequest, GetDialogsRequest)
+from telethon.tl.functions.upload import SaveFilePartRequest, SaveBigFilePartRequest
+
+from telegram.telegram_client import InstrumentedTelegramClient
+
+FLOOD_WAIT_REQUESTS = (SendMessageRequest, SendMediaRequest, SendMultiMediaRequest, SendReactionRequest,
+                       JoinChannelRequest, LeaveChannelRequest)
+
+
+@dataclass
+class FakeTelegramProfile:
+    rpc_latency: float = 0.05
+    rpc_jitter: float = 0.02
+    connect_latency: float = 0.0
+    flood_wait_rate: float = 0.0
+    flood_wait_seconds: int = 1
+    upload_bytes_per_second: float = 10 * 1024 * 1024
+    connection_bytes_per_second: float = 4 * 1024 * 1024
+    upload_part_failure_rate: float = 0.0
+    file_reference_lifetime: float = 3600
+    seed: int = 0
+
+
+class FakeTelegramClient(InstrumentedTelegramClient):
+    """Real telethon client whose network layer answers locally with configurable latency and FloodWait.
+
+    File parts queue per connection at connection_bytes_per_second and share one upload_bytes_per_second link,
+    their acknowledgement round trips overlap."""
+
+    def __init__(self, profile: FakeTelegramProfile):
+        super().__init__(StringSession(), api_id=1, api_hash="benchmark")
+        self.profile = profile
+        self.requests = 0
+        self.flood_waits = 0
+        self.uploaded_bytes = 0
+        self.failed_parts = 0
+        self.upload_connections = 0
+        self.__connected = False
+        self.__link_free_at = 0.0
+        self.__connection_locks: Dict[int, asyncio.Lock] = {}
+        self.__random = random.Random(profile.seed)
+        self.__message_ids = itertools.count(1)
+        self.__documents: Dict[int, Tuple[int, bytes, float]] = {}
+
+    async def connect(self):
+        await asyncio.sleep(self.profile.connect_latency + self.__latency())
+        self.__connected = True
+
+    def is_connected(self) -> bool:
+        return self.__connected
+
+    async def disconnect(self):
+        self.__connected = False
+
+    async def _connect_upload_sender(self):
+        await asyncio.sleep(self.__latency())
+        self.upload_connections += 1
+        return object()
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.requests += 1
+        if isinstance(request, (SaveFilePartRequest, SaveBigFilePartRequest)):
+            await self.__transfer(sender, len(request.bytes))
+            await asyncio.sleep(self.__latency())
+            if self.__random.random() < self.profile.upload_part_failure_rate:
+                self.failed_parts += 1
+                raise ConnectionError("fake connection reset while saving file part")
+            self.uploaded_bytes += len(request.bytes)
+            return True
+        await asyncio.sleep(self.__latency())
+        if isinstance(request, FLOOD_WAIT_REQUESTS) and self.__random.random() < self.profile.flood_wait_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=request, capture=self.profile.flood_wait_seconds)
+        if isinstance(request, SendMessageRequest):
+            return types.UpdateShortSentMessage(id=next(self.__message_ids), pts=0, pts_count=0,
+                                                date=datetime.datetime.now(), out=True)
+        if isinstance(request, SendMediaRequest):
+            media = self.__sent_media(request, request.media)
+            return self.__sent_messages(peer=request.peer, random_ids=[request.random_id], media=[media])
+        if isinstance(request, SendMultiMediaRequest):
+            media = [self.__sent_media(request, item.media) for item in request.multi_media]
+            return self.__sent_messages(peer=request.peer, random_ids=[item.random_id for item in request.multi_media],
+                                        media=media)
+        if isinstance(request, UploadMediaRequest):
+            return types.MessageMediaDocument(document=self.__new_document())
+        if isinstance(request, (SendReactionRequest, JoinChannelRequest, LeaveChannelRequest)):
+            return types.Updates(updates=[], users=[], chats=[], date=datetime.datetime.now(), seq=0)
+        if isinstance(request, GetDialogsRequest):
+            return types.messages.Dialogs(dialogs=[], messages=[], chats=[], users=[])
+        raise NotImplementedError(f"fake telegram backend does not answer {type(request).__name__}")
+
+    async def __transfer(self, sender, size: int):
+        lock = self.__connection_locks.setdefault(id(sender), asyncio.Lock())
+        async with lock:
+            now = asyncio.get_running_loop().time()
+            self.__link_free_at = max(self.__link_free_at, now) + size / self.profile.upload_bytes_per_second
+            await asyncio.sleep(max(now + size / self.profile.connection_bytes_per_second, self.__link_free_at) - now)
+
+    def __latency(self) -> float:
+        jitter = self.__random.uniform(-self.profile.rpc_jitter, self.profile.rpc_jitter)
+        return max(self.profile.rpc_latency + jitter, 0.0)
+
+    def __new_document(self) -> types.Document:
+        document_id, access_hash = self.__random.getrandbits(63), self.__random.getrandbits(63)
+        file_reference = self.__random.randbytes(16)
+        self.__documents[document_id] = (access_hash, file_reference, time.monotonic())
+        return types.Document(id=document_id, access_hash=access_hash, file_reference=file_reference,
+                              date=datetime.datetime.now(), mime_type="application/octet-stream", size=0, dc_id=2,
+                              attributes=[])
+
+    def __sent_media(self, request, media) -> types.MessageMediaDocument:
+        if isinstance(media, types.InputMediaDocument) and isinstance(media.id, types.InputDocument):
+            known = self.__documents.get(media.id.id)
+            if known is None or known[0] != media.id.access_hash or known[1] != media.id.file_reference:
+                raise FileReferenceInvalidError(request=request)
+            if time.monotonic() - known[2] > self.profile.file_reference_lifetime:
+                raise FileReferenceExpiredError(request=request)
+            return types.MessageMediaDocument(document=types.Document(
+                id=media.id.id, access_hash=known[0], file_reference=known[1], date=datetime.datetime.now(),
+                mime_type="application/octet-stream", size=0, dc_id=2, attributes=[]
+            ))
+        return types.MessageMediaDocument(document=self.__new_document())
+
+    def __sent_messages(self, peer, random_ids, media) -> types.Updates:
+        updates = []
+        for random_id, message_media in zip(random_ids, media):
+            message_id = next(self.__message_ids)
+            updates.append(types.UpdateMessageID(id=message_id, random_id=random_id))
+            updates.append(types.UpdateNewMessage(
+                message=types.Message(id=message_id, peer_id=utils.get_peer(peer), date=datetime.datetime.now(),
+                                      message="", out=True, media=message_media),
+                pts=0, pts_count=0
+            ))
+        return types.Updates(updates=updates, users=[], chats=[], date=datetime.datetime.now(), seq=0)
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import resource
+import sys
+import time
+from typing import Dict, List, Union
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from telethon import utils
+from telethon.tl.types import PeerChannel
+
+import main
+from api.api_models import AdminBulkUserModel
+from benchmarks.fake_telegram import FakeTelegramClient, FakeTelegramProfile
+from database.database import AsyncMongoClient, mongo_connection
+from database.models import SessionDbModel, EntityDbModel, PeerTypeEnum
+from telegram.client_pool import client_pool
+from telegram.media_cache import media_cache
+from telegram.scheduler import scheduler, RpcKind
+
+PASSWORD = "password"
+USER_PEER_ID = 1000
+CHANNEL_ID = 2000
+CHANNEL_USERNAME = "benchmark_channel"
+DEFAULT_MIX = "login=5,send_message=30,send_files=10,like=30,subscribe=5,history=20"
+
+
+class ScratchClient:
+    """Motor client whose telegram_db is a scratch database, so a run never touches real data."""
+
+    def __init__(self, client: AsyncIOMotorClient, database_name: str):
+        self.client = client
+        self.telegram_db = client[database_name]
+
+    def close(self):
+        self.client.close()
+
+
+class VirtualUser:
+
+    def __init__(self, http: httpx.AsyncClient, username: str, file_count: int, file_bytes: bytes,
+                 unique_files: bool = False):
+        self.http = http
+        self.username = username
+        self.file_count = file_count
+        self.file_bytes = file_bytes
+        self.unique_files = unique_files
+        self.headers: Dict[str, str] = {}
+
+    async def login(self) -> httpx.Response:
+        response = await self.http.post("/login", data={"username": self.username, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def send_message(self) -> httpx.Response:
+        return await self.http.post("/users/send_message", headers=self.headers, data={
+            "message": json.dumps({"chat_id": USER_PEER_ID, "text_message": "benchmark"})
+        })
+
+    async def send_files(self) -> httpx.Response:
+        files = [("upload_files", (f"payload_{index}.bin",
+                                   os.urandom(len(self.file_bytes)) if self.unique_files else self.file_bytes,
+                                   "application/octet-stream"))
+                 for index in range(self.file_count)]
+        return await self.http.post("/users/send_message", headers=self.headers, files=files, data={
+            "message": json.dumps({"chat_id": USER_PEER_ID, "text_message": "benchmark"})
+        })
+
+    async def like(self) -> httpx.Response:
+        return await self.http.post("/users/like_message", headers=self.headers,
+                                    json={"chat_id": USER_PEER_ID, "message_id": 1})
+
+    async def subscribe(self) -> httpx.Response:
+        return await self.http.post("/users/subscribe_channel", headers=self.headers,
+                                    json={"channel_name": CHANNEL_USERNAME, "subscribe_flag": True})
+
+    async def history(self) -> httpx.Response:
+        return await self.http.get("/users/history", headers=self.headers, params={"limit": 10})
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if not callable(getattr(VirtualUser, name.strip(), None)):
+            raise ValueError(f"unknown operation {name} in --mix")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def in_memory_mongo():
+    try:
+        import mongomock.collection
+        import mongomock.database
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("pip install mongomock-motor or pass --mongo-uri of a local mongod")
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, selector, doc, multi, upsert, collation=None, array_filters=None, hint=None,
+                                sort=None):
+        # pymongo 4.11 passes sort to bulk updates, mongomock 4.3 does not know it
+        return add_update(self, selector, doc, multi, upsert, collation=collation, array_filters=array_filters,
+                          hint=hint)
+
+    mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+    create_collection = mongomock.database.Database.create_collection
+
+    def create_collection_without_cap(self, name, **kwargs):
+        # mongomock has no capped collections, job_events is a plain one there and its tail is re-read
+        kwargs.pop("capped", None)
+        kwargs.pop("size", None)
+        return create_collection(self, name, **kwargs)
+
+    mongomock.database.Database.create_collection = create_collection_without_cap
+    return AsyncMongoMockClient()
+
+
+async def seed(db: AsyncMongoClient, operators: int) -> List[str]:
+    await db.create_indexes()
+    users = []
+    for index in range(operators):
+        session_id = await db.add_new_session(SessionDbModel(session_file_name=f"benchmark_{index}.session",
+                                                             telegram_api_id=1, telegram_api_hash="benchmark"))
+        await db.save_cached_entities([
+            EntityDbModel(session_id=session_id, peer_id=USER_PEER_ID, entity_id=USER_PEER_ID,
+                          peer_type=PeerTypeEnum.user, access_hash=1),
+            EntityDbModel(session_id=session_id, peer_id=utils.get_peer_id(PeerChannel(CHANNEL_ID)),
+                          entity_id=CHANNEL_ID, peer_type=PeerTypeEnum.channel, access_hash=1,
+                          username=CHANNEL_USERNAME)
+        ])
+        users.append(AdminBulkUserModel(username=f"benchmark_{index}", user_password=PASSWORD,
+                                        user_session_id=session_id, user_description="load test"))
+    await db.bulk_upsert_users_by_admin(users=users)
+    return [user.username for user in users]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else 0.0,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else 0.0,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else 0.0,
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+
+async def run(args, motor_client) -> dict:
+    profile = FakeTelegramProfile(rpc_latency=args.rpc_latency_ms / 1000, rpc_jitter=args.rpc_jitter_ms / 1000,
+                                  flood_wait_rate=args.flood_wait_rate, flood_wait_seconds=args.flood_wait_seconds,
+                                  upload_bytes_per_second=args.upload_mbps * 1024 * 1024 / 8,
+                                  connection_bytes_per_second=args.connection_mbps * 1024 * 1024 / 8,
+                                  file_reference_lifetime=args.file_reference_lifetime, seed=args.seed)
+    fake_clients: List[FakeTelegramClient] = []
+
+    async def fake_client_factory(session_id: str, session: SessionDbModel) -> FakeTelegramClient:
+        client = FakeTelegramClient(profile=dataclasses.replace(profile, seed=profile.seed + len(fake_clients)))
+        fake_clients.append(client)
+        await client.connect()
+        return client
+
+    client_pool.client_factory = fake_client_factory
+    scheduler.limits = {kind: (args.scheduler_rate, max(int(args.scheduler_rate), 1)) for kind in RpcKind}
+    mongo_connection.client = motor_client
+    usernames = await seed(AsyncMongoClient(client=motor_client), operators=args.operators)
+    mix = parse_mix(args.mix)
+    operations, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = {name: [] for name in operations}
+    statuses: Dict[str, Dict[str, int]] = {name: {} for name in operations}
+    file_bytes = os.urandom(args.file_kb * 1024)
+    remaining = [args.requests]
+
+    def record(name: str, elapsed: float, status_code: Union[int, str]):
+        latencies[name].append(elapsed)
+        statuses[name][str(status_code)] = statuses[name].get(str(status_code), 0) + 1
+
+    async def virtual_user(index: int, http: httpx.AsyncClient):
+        rng = random.Random(args.seed + index)
+        user = VirtualUser(http=http, username=usernames[index % len(usernames)], file_count=args.files,
+                           file_bytes=file_bytes, unique_files=args.unique_files)
+        await user.login()
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(operations, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(user, name)()
+                record(name, time.perf_counter() - start, response.status_code)
+            except Exception as ex:
+                record(name, time.perf_counter() - start, type(ex).__name__)
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+            baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.perf_counter()
+            await asyncio.gather(*[virtual_user(index, http) for index in range(args.concurrency)])
+            elapsed = time.perf_counter() - start
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "requests": completed,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(completed / elapsed, 1),
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "peak_rss_growth_mb": round((peak_rss - baseline_rss) / 1024, 1),
+        "telegram_rpcs": sum(client.requests for client in fake_clients),
+        "telegram_flood_waits": sum(client.flood_waits for client in fake_clients),
+        "uploaded_mb": round(sum(client.uploaded_bytes for client in fake_clients) / 1024 / 1024, 1),
+        "media_cache_hit_rate": round(media_cache.stats()["hit_rate"], 3),
+        "media_cache_saved_mb": round(media_cache.saved_bytes / 1024 / 1024, 1),
+        "media_cache_stale": media_cache.stale,
+        "operations": {name: summarize(latencies[name], statuses[name]) for name in operations},
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    found = []
+    if result["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        found.append(f"throughput {result['throughput_rps']} rps, baseline {baseline['throughput_rps']} rps")
+    for name, stats in result["operations"].items():
+        base = baseline["operations"].get(name)
+        if base is None:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            found.append(f"{name} p95 {stats['p95_ms']} ms, baseline {base['p95_ms']} ms")
+        failed = sum(count for code, count in stats["statuses"].items() if not code.startswith("2"))
+        base_failed = sum(count for code, count in base["statuses"].items() if not code.startswith("2"))
+        if failed > base_failed:
+            found.append(f"{name} failed {failed} times, baseline {base_failed}")
+    return found
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="Load test the real app against a fake telegram backend")
+    parser.add_argument("--mongo-uri", default=None, help="local mongod, in-memory mongomock when omitted")
+    parser.add_argument("--database", default="telegram_db_load_test", help="scratch database, dropped after the run")
+    parser.add_argument("--operators", type=int, default=8, help="operators, each with its own telegram session")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight list")
+    parser.add_argument("--files", type=int, default=2, help="files per send_files request")
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--unique-files", action="store_true", help="random bytes per send, no media cache hits")
+    parser.add_argument("--file-reference-lifetime", type=float, default=3600,
+                        help="seconds until a sent media file reference expires")
+    parser.add_argument("--rpc-latency-ms", type=float, default=50)
+    parser.add_argument("--rpc-jitter-ms", type=float, default=20)
+    parser.add_argument("--flood-wait-rate", type=float, default=0.0, help="share of send/react/join rpcs")
+    parser.add_argument("--flood-wait-seconds", type=int, default=1)
+    parser.add_argument("--upload-mbps", type=float, default=80, help="per client upload throughput, megabits")
+    parser.add_argument("--connection-mbps", type=float, default=32, help="upload throughput of one connection")
+    parser.add_argument("--scheduler-rate", type=float, default=1000,
+                        help="per session rpc rate, high by default so the limiter does not dominate the numbers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help="write the result as json, to be used as --baseline later")
+    parser.add_argument("--baseline", default=None, help="fail when worse than this saved result")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.mongo_uri is not None:
+        motor_client = ScratchClient(client=AsyncIOMotorClient(args.mongo_uri), database_name=args.database)
+    else:
+        motor_client = in_memory_mongo()
+    try:
+        result = await run(args, motor_client)
+    finally:
+        if args.mongo_uri is not None:
+            cleanup_client = AsyncIOMotorClient(args.mongo_uri)
+            await cleanup_client.drop_database(args.database)
+            cleanup_client.close()
+    for name, stats in result["operations"].items():
+        print({"operation": name, **stats})
+    print({key: value for key, value in result.items() if key != "operations"})
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            found = regressions(result, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
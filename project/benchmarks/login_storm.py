@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from api.auth_utils import authenticate_user, pwd_context
+from database.models import UserDbModel
+
+USERNAME = "operator"
+PASSWORD = "password"
+
+
+class InMemoryUsers:
+
+    def __init__(self):
+        self.user = UserDbModel(username=USERNAME, user_hashed_password=pwd_context.hash(PASSWORD), user_session_id="")
+
+    async def get_user_by_login(self, username: str) -> UserDbModel:
+        return self.user
+
+
+async def inline_authenticate_user(db: InMemoryUsers, login: str, password: str):
+    user = await db.get_user_by_login(username=login)
+    return user if pwd_context.verify(password, user.user_hashed_password) else None
+
+
+async def measure_loop_lag(interval: float, stop: asyncio.Event, lags: List[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run_storm(logins: int, concurrency: int, inline: bool) -> dict:
+    db = InMemoryUsers()
+    authenticate = inline_authenticate_user if inline else authenticate_user
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    lags: List[float] = []
+
+    async def login():
+        async with semaphore:
+            assert await authenticate(db, USERNAME, PASSWORD) is not None
+
+    monitor = asyncio.create_task(measure_loop_lag(interval=0.005, stop=stop, lags=lags))
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    lags.sort()
+    return {
+        "mode": "inline" if inline else "executor",
+        "logins_per_second": round(logins / elapsed, 1),
+        "loop_lag_p50_ms": round(statistics.median(lags) * 1000, 2),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2),
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Login storm: bcrypt throughput and event loop responsiveness")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    for inline in (True, False):
+        print(await run_storm(logins=args.logins, concurrency=args.concurrency, inline=inline))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import time
+
+from metrics import Counter, Histogram, timed
+
+
+async def noop():
+    return None
+
+
+def per_event_ns(elapsed: float, events: int) -> float:
+    return round(elapsed / events * 1e9, 1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Cost of one metrics event: observe, inc and a timed coroutine")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    args = parser.parse_args()
+    histogram = Histogram("benchmark_seconds", "benchmark", ("method",))
+    counter = Counter("benchmark_total", "benchmark", ("method", "status"))
+
+    start = time.perf_counter()
+    for index in range(args.events):
+        histogram.observe(index % 100 / 1000, "send_message")
+    print({"histogram_observe_ns": per_event_ns(time.perf_counter() - start, args.events)})
+
+    start = time.perf_counter()
+    for _ in range(args.events):
+        counter.inc("send_message", "200")
+    print({"counter_inc_ns": per_event_ns(time.perf_counter() - start, args.events)})
+
+    instrumented = timed(noop, histogram=histogram, errors=counter, label="noop")
+    for name, function in (("bare_coroutine_ns", noop), ("timed_coroutine_ns", instrumented)):
+        start = time.perf_counter()
+        for _ in range(args.events):
+            await function()
+        print({name: per_event_ns(time.perf_counter() - start, args.events)})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
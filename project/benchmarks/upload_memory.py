@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from fastapi import UploadFile
+from telethon.sessions import StringSession
+
+from telegram.telegram_client import InstrumentedTelegramClient
+from telegram.uploads import upload_stream
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DiscardingClient(InstrumentedTelegramClient):
+
+    def __init__(self):
+        super().__init__(StringSession(), api_id=1, api_hash="benchmark")
+        self.uploaded_bytes = 0
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.uploaded_bytes += len(getattr(request, "bytes", b""))
+        return True
+
+    async def _connect_upload_sender(self):
+        return object()
+
+
+def make_spooled_upload(size_mb: int) -> UploadFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+    chunk = os.urandom(CHUNK_SIZE)
+    for _ in range(size_mb):
+        spool.write(chunk)
+    spool.seek(0)
+    return UploadFile(file=spool, size=size_mb * CHUNK_SIZE, filename="video.mp4")
+
+
+async def upload_buffered(client: DiscardingClient, upload_file: UploadFile):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = os.path.join(temp_dir, upload_file.filename)
+        with open(file_name, "wb") as temp_file:
+            temp_file.write(upload_file.file.read())
+        await client.upload_file(file=file_name)
+
+
+async def run_mode(mode: str, size_mb: int):
+    client = DiscardingClient()
+    upload_file = make_spooled_upload(size_mb)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "streaming":
+        await upload_stream(client=client, upload_file=upload_file)
+    else:
+        await upload_buffered(client=client, upload_file=upload_file)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print({
+        "mode": mode,
+        "file_mb": size_mb,
+        "uploaded_mb": round(client.uploaded_bytes / CHUNK_SIZE, 1),
+        "seconds": round(elapsed, 2),
+        "peak_rss_growth_mb": round((peak_rss - baseline_rss) / 1024, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of one upload: streaming vs whole-file buffering")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--mode", choices=["streaming", "buffered"], default=None)
+    args = parser.parse_args()
+    if args.mode is not None:
+        asyncio.run(run_mode(mode=args.mode, size_mb=args.size_mb))
+        return
+    for mode in ("buffered", "streaming"):
+        subprocess.run([sys.executable, "-m", "benchmarks.upload_memory", "--mode", mode,
+                        "--size-mb", str(args.size_mb)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import UploadFile
+
+from benchmarks.fake_telegram import FakeTelegramClient, FakeTelegramProfile
+from config import get_settings
+from telegram.uploads import upload_stream
+
+CHUNK_SIZE = 1024 * 1024
+
+settings = get_settings()
+
+
+def make_spooled_upload(size_mb: int) -> UploadFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+    chunk = os.urandom(CHUNK_SIZE)
+    for _ in range(size_mb):
+        spool.write(chunk)
+    spool.seek(0)
+    return UploadFile(file=spool, size=size_mb * CHUNK_SIZE, filename="video.mp4")
+
+
+async def run_case(profile: FakeTelegramProfile, size_mb: int, parallel_parts: int, connections: int) -> dict:
+    settings.UPLOAD_PARALLEL_PARTS, settings.UPLOAD_CONNECTIONS = parallel_parts, connections
+    client = FakeTelegramClient(profile=profile)
+    upload_file = make_spooled_upload(size_mb)
+    progress = []
+
+    async def on_progress(uploaded_bytes: int, parts_done: int, parts: int, retries: int):
+        progress.append((parts_done, parts, retries))
+
+    start = time.perf_counter()
+    await upload_stream(client=client, upload_file=upload_file, on_progress=on_progress)
+    elapsed = time.perf_counter() - start
+    assert client.uploaded_bytes == size_mb * CHUNK_SIZE and progress[-1][0] == progress[-1][1]
+    return {
+        "parallel_parts": parallel_parts,
+        "connections": client.upload_connections or 1,
+        "seconds": round(elapsed, 2),
+        "mb_per_second": round(size_mb / elapsed, 2),
+        "retried_parts": progress[-1][2],
+    }
+
+
+async def run(args):
+    profile = FakeTelegramProfile(rpc_latency=args.rpc_latency_ms / 1000, rpc_jitter=0.0,
+                                  upload_bytes_per_second=args.link_mbps * 1024 * 1024 / 8,
+                                  connection_bytes_per_second=args.connection_mbps * 1024 * 1024 / 8,
+                                  upload_part_failure_rate=args.part_failure_rate, seed=args.seed)
+    for connections in args.connections:
+        for parallel_parts in args.parallel_parts:
+            if parallel_parts < connections:
+                continue
+            print(await run_case(profile=profile, size_mb=args.size_mb, parallel_parts=parallel_parts,
+                                 connections=connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of one big upload by parts in flight and connections, "
+                                                 "against the fake telegram backend")
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--parallel-parts", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--rpc-latency-ms", type=float, default=100)
+    parser.add_argument("--connection-mbps", type=float, default=32, help="upload throughput of one connection")
+    parser.add_argument("--link-mbps", type=float, default=100, help="upload throughput shared by all connections")
+    parser.add_argument("--part-failure-rate", type=float, default=0.0, help="share of parts failing once")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from typing import Union, List, Tuple
+
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+
+from config import get_settings
+from metrics import registry
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+AuditRecord = Tuple[str, dict]
+
+
+def is_duplicate_retry(ex: Exception) -> bool:
+    return isinstance(ex, BulkWriteError) and \
+        all(error.get("code") == 11000 for error in ex.details.get("writeErrors", []))
+
+
+class AuditWriter:
+    """Write-behind buffer for audit records, flushed with insert_many by size or time.
+
+    Every flushed batch of actions is folded into minute, hour and day rollups with one bulk of $inc upserts.
+    """
+
+    def __init__(self, max_buffer_size: int, batch_size: int, flush_interval: float,
+                 write_concern: WriteConcern, max_retries: int = 3):
+        self.max_buffer_size = max_buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_concern = write_concern
+        self.max_retries = max_retries
+        self.flushes = 0
+        self.flushed_records = 0
+        self.dropped_records = 0
+        self.rollup_failures = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.__db = None
+        self.__queue: Union[asyncio.Queue, None] = None
+        self.__task: Union[asyncio.Task, None] = None
+
+    @property
+    def running(self) -> bool:
+        return self.__task is not None and not self.__task.done()
+
+    def start(self, db):
+        self.__db = db
+        self.__queue = asyncio.Queue(maxsize=self.max_buffer_size)
+        self.__task = asyncio.create_task(self.__run())
+
+    async def close(self):
+        if not self.running:
+            return
+        await self.__queue.put(None)
+        await self.__task
+        self.__task = None
+
+    async def put(self, collection: str, document: dict):
+        await self.__queue.put((collection, document))
+
+    async def put_many(self, records: List[AuditRecord]):
+        for record in records:
+            await self.__queue.put(record)
+
+    def stats(self) -> dict:
+        return {
+            "buffer_depth": self.__queue.qsize() if self.__queue is not None else 0,
+            "max_buffer_size": self.max_buffer_size,
+            "flushes": self.flushes,
+            "flushed_records": self.flushed_records,
+            "dropped_records": self.dropped_records,
+            "rollup_failures": self.rollup_failures,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "avg_flush_latency": self.total_flush_latency / self.flushes if self.flushes else 0.0,
+        }
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            record = await self.__queue.get()
+            if record is None:
+                return
+            batch: List[AuditRecord] = [record]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self.__queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self.__queue.get(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    record = self.__queue.get_nowait()
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self.__flush(batch)
+
+    async def __flush(self, batch: List[AuditRecord]):
+        documents = {}
+        for collection, document in batch:
+            documents.setdefault(collection, []).append(document)
+        start = time.perf_counter()
+        for collection, collection_documents in documents.items():
+            inserted = False
+            for attempt in range(self.max_retries):
+                try:
+                    await self.__db.insert_audit_records(collection=collection, documents=collection_documents,
+                                                         write_concern=self.write_concern)
+                    self.flushed_records += len(collection_documents)
+                    inserted = True
+                    break
+                except Exception as ex:
+                    if attempt > 0 and is_duplicate_retry(ex):
+                        self.flushed_records += len(collection_documents)
+                        inserted = True
+                        break
+                    if attempt == self.max_retries - 1:
+                        self.dropped_records += len(collection_documents)
+                        logger.error(f"dropped {len(collection_documents)} {collection} audit records: {ex}")
+                    else:
+                        await asyncio.sleep(2 ** attempt)
+            if inserted and collection == "actions":
+                try:
+                    await self.__db.update_action_rollups(collection_documents)
+                except Exception as ex:
+                    self.rollup_failures += 1
+                    logger.error(f"cannot update rollups of {len(collection_documents)} actions: {ex}")
+        latency = time.perf_counter() - start
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+
+
+audit_writer = AuditWriter(
+    max_buffer_size=settings.AUDIT_BUFFER_MAX_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    write_concern=WriteConcern(w=settings.AUDIT_WRITE_CONCERN_W)
+)
+
+registry.gauge("audit_buffer_depth", "Audit records waiting to be flushed", lambda: audit_writer.stats()["buffer_depth"])
+registry.gauge("audit_dropped_records", "Audit records dropped after retries",
+               lambda: audit_writer.stats()["dropped_records"])
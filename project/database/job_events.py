@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Union, Dict
+
+from bson import ObjectId
+
+from database.models import JobEventEnum
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# pause before the tailable cursor is opened again after it was closed or failed
+RETAIL_INTERVAL = 0.1
+
+
+class JobEvents:
+    """One tailable cursor per worker on the capped job_events collection. Wakes the job runner when a job is
+    queued and hands output and finished events to the request that waits on the job, so neither polls Mongo."""
+
+    def __init__(self):
+        self.events = 0
+        self.__db = None
+        self.__queued = asyncio.Event()
+        self.__subscribers: Dict[ObjectId, asyncio.Queue] = {}
+        self.__task: Union[asyncio.Task, None] = None
+
+    def start(self, db):
+        self.__db = db
+        self.__task = asyncio.create_task(self.__tail())
+
+    async def close(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            await asyncio.gather(self.__task, return_exceptions=True)
+            self.__task = None
+        self.__subscribers.clear()
+
+    async def publish(self, job_id: ObjectId, event: JobEventEnum, data: Union[dict, None] = None):
+        try:
+            await self.__db.publish_job_event(job_id=job_id, event=event, data=data)
+        except Exception as ex:
+            # waiters fall back to the job document, runners to their poll interval
+            logger.error(f"cannot publish {event.value} event of job {job_id}: {ex}")
+
+    def subscribe(self, job_id: ObjectId) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.__subscribers[job_id] = queue
+        return queue
+
+    def unsubscribe(self, job_id: ObjectId):
+        self.__subscribers.pop(job_id, None)
+
+    async def wait_queued(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.__queued.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.__queued.clear()
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "subscribers": len(self.__subscribers),
+        }
+
+    async def __tail(self):
+        after, positioned = None, False
+        while True:
+            try:
+                if not positioned:
+                    # events published before this worker started are of no interest
+                    after, positioned = await self.__db.get_last_job_event_id(), True
+                cursor = self.__db.tail_job_events(after=after)
+                while cursor.alive:
+                    async for event in cursor:
+                        after = event["_id"]
+                        self.__dispatch(event)
+            except Exception as ex:
+                logger.error(f"cannot tail job events: {ex}")
+            await asyncio.sleep(RETAIL_INTERVAL)
+
+    def __dispatch(self, event: dict):
+        if "event" not in event:
+            return
+        self.events += 1
+        if event["event"] == JobEventEnum.queued:
+            self.__queued.set()
+            return
+        queue = self.__subscribers.get(event["job_id"])
+        if queue is not None:
+            queue.put_nowait(event)
+
+
+job_events = JobEvents()
+
+registry.gauge("job_events_waiting_requests", "Requests on this worker waiting for a job of another worker",
+               lambda: job_events.stats()["subscribers"])
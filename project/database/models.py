@@ -1,5 +1,6 @@
 import datetime
 from enum import Enum
+from typing import Optional, List
 
 from pydantic import BaseModel, Field
 
@@ -12,8 +13,32 @@ class ActionsEnum(str, Enum):
     subscribe_channel = "subscribe_channel"
     enable_2fa = "enable_2fa"
     get_history = "get_history"
+    get_dialogs = "get_dialogs"
+    bulk_send_message = "bulk_send_message"
+    bulk_like_message = "bulk_like_message"
+    bulk_comment_message = "bulk_comment_message"
+    rate_limit_status = "rate_limit_status"
     
     
+class PeerTypeEnum(str, Enum):
+    user = "user"
+    chat = "chat"
+    channel = "channel"
+
+
+class JobStatusEnum(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class JobEventEnum(str, Enum):
+    queued = "queued"
+    output = "output"
+    finished = "finished"
+
+
 class UserRoles(str, Enum):
     admin = "admin"
     operator = "operator"
@@ -32,16 +57,126 @@ class SessionDbModel(BaseModel):
     telegram_api_id: int = Field(description="telegram api id")
     telegram_api_hash: str = Field(description="telegram api hash")
 
+class EntityDbModel(BaseModel):
+    session_id: str = Field(description="session id the access hash belongs to")
+    peer_id: int = Field(description="marked peer id (-100... for channels, -... for chats)")
+    entity_id: int = Field(description="raw telegram entity id")
+    peer_type: PeerTypeEnum = Field(description="peer type")
+    access_hash: int = Field(description="entity access hash for the session", default=0)
+    username: Optional[str] = Field(description="lowercase entity username", default=None)
+    phone: Optional[str] = Field(description="user phone", default=None)
+    name: Optional[str] = Field(description="entity display name", default=None)
+
+class DialogDbModel(BaseModel):
+    session_id: str = Field(description="session id the dialog belongs to")
+    peer_id: int = Field(description="marked peer id of dialog")
+    title: str = Field(description="dialog title")
+    type: PeerTypeEnum = Field(description="dialog peer type")
+    unread_count: int = Field(description="number of unread messages", default=0)
+    date: Optional[datetime.datetime] = Field(description="date of the last message", default=None)
+    top_message_id: int = Field(description="id of the last message", default=0)
+    version: int = Field(description="session dialog snapshot version of the last change", default=0)
+    deleted: bool = Field(description="dialog was left or removed", default=False)
+
 class MessageDbModel(BaseModel):
     message_id: int = Field(description="message id")
     message_text: str = Field(description="message text")
     sender_username: str = Field(description="author of message")
     recipient_id: str = Field(description="recipient of message")
-    created_at: datetime.datetime = Field(description="time of message creation", default=datetime.datetime.now())
+    created_at: datetime.datetime = Field(description="time of message creation", default_factory=datetime.datetime.now)
 
 
 class ActionsDbModel(BaseModel):
+    username: Optional[str] = Field(description="operator who did the action", default=None)
+    session_id: Optional[str] = Field(description="telegram session the action was done with", default=None)
     action_type: ActionsEnum = Field(description="action type")
     action_data: dict = Field(description="action data")
     action_status: bool = Field(description="if action was successful")
-    action_time: datetime.datetime = Field(description="action time", default=datetime.datetime.now())
+    action_time: datetime.datetime = Field(description="action time, actions expire by ttl index on it",
+                                           default_factory=datetime.datetime.now)
+
+
+class RollupGranularityEnum(str, Enum):
+    minute = "minute"
+    hour = "hour"
+    day = "day"
+
+
+class RollupGroupEnum(str, Enum):
+    username = "username"
+    session_id = "session_id"
+
+
+class ActionRollupModel(BaseModel):
+    bucket: datetime.datetime = Field(description="start of minute, hour or day bucket")
+    username: Optional[str] = Field(description="operator, set when grouped by username", default=None)
+    session_id: Optional[str] = Field(description="telegram session, set when grouped by session_id", default=None)
+    action_type: ActionsEnum = Field(description="action type")
+    total: int = Field(description="actions in bucket")
+    failures: int = Field(description="failed actions in bucket")
+
+
+class CachedMediaTypeEnum(str, Enum):
+    photo = "photo"
+    document = "document"
+
+
+class CachedMediaDbModel(BaseModel):
+    session_id: str = Field(description="session the media reference belongs to")
+    sha256: str = Field(description="sha256 of uploaded file content")
+    media_type: CachedMediaTypeEnum = Field(description="photo or document")
+    media_id: int = Field(description="telegram photo or document id")
+    access_hash: int = Field(description="access hash of photo or document for the session")
+    file_reference: bytes = Field(description="file reference of the sent media, refreshed when it expires")
+    size: int = Field(description="file size in bytes")
+    created_at: datetime.datetime = Field(description="time the media was cached", default_factory=datetime.datetime.now)
+
+
+class UploadStatusEnum(str, Enum):
+    pending = "pending"
+    uploading = "uploading"
+    done = "done"
+    cached = "cached"
+    failed = "failed"
+
+
+class UploadFileProgressModel(BaseModel):
+    filename: Optional[str] = Field(description="original file name", default=None)
+    size: int = Field(description="file size in bytes")
+    uploaded_bytes: int = Field(description="bytes of saved parts", default=0)
+    parts: int = Field(description="parts of the file, known once its upload starts", default=0)
+    parts_done: int = Field(description="parts saved by telegram", default=0)
+    retries: int = Field(description="parts sent again after an error", default=0)
+    status: UploadStatusEnum = Field(description="upload status, cached files are not uploaded",
+                                     default=UploadStatusEnum.pending)
+
+
+class UploadProgressDbModel(BaseModel):
+    username: str = Field(description="user who sends the files")
+    upload_id: str = Field(description="id chosen by the client")
+    files: List[UploadFileProgressModel] = Field(description="progress per file, in request order", default=[])
+    updated_at: datetime.datetime = Field(description="last progress update time", default_factory=datetime.datetime.now)
+    expires_at: datetime.datetime = Field(description="progress is deleted after")
+
+
+class JobFileModel(BaseModel):
+    file_id: str = Field(description="id of the uploaded file in the job_files GridFS bucket")
+    filename: str = Field(description="original file name")
+    size: int = Field(description="file size in bytes")
+
+
+class JobDbModel(BaseModel):
+    job_type: ActionsEnum = Field(description="operation to run")
+    username: str = Field(description="user who submitted the job")
+    session_id: Optional[str] = Field(description="telegram session the job runs on", default=None)
+    payload: dict = Field(description="operation request body")
+    files: List[JobFileModel] = Field(description="uploaded files of the job", default=[])
+    status: JobStatusEnum = Field(description="job status", default=JobStatusEnum.queued)
+    result: dict = Field(description="operation result", default={})
+    error: Optional[str] = Field(description="error of failed job", default=None)
+    attempts: int = Field(description="number of times the job was started", default=0)
+    owner: Optional[str] = Field(description="worker running the job", default=None)
+    lease_expires_at: Optional[datetime.datetime] = Field(description="running job is requeued after", default=None)
+    not_before: datetime.datetime = Field(description="job is not started before", default_factory=datetime.datetime.now)
+    created_at: datetime.datetime = Field(description="job creation time", default_factory=datetime.datetime.now)
+    updated_at: datetime.datetime = Field(description="last job update time", default_factory=datetime.datetime.now)
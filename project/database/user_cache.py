@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Union, Tuple
+
+from config import get_settings
+from database.models import UserDbModel
+
+settings = get_settings()
+
+
+class UserCache:
+
+    def __init__(self, max_size: int, ttl: float, version_poll_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_poll_interval = version_poll_interval
+        self.generation = 0
+        self.__users: "OrderedDict[str, Tuple[float, UserDbModel]]" = OrderedDict()
+        self.__version: Union[int, None] = None
+        self.__poll_task: Union[asyncio.Task, None] = None
+
+    def get(self, username: str) -> Union[UserDbModel, None]:
+        item = self.__users.get(username)
+        if item is None:
+            return None
+        expires_at, user = item
+        if expires_at < time.monotonic():
+            del self.__users[username]
+            return None
+        self.__users.move_to_end(username)
+        return user
+
+    def put(self, username: str, user: UserDbModel, generation: int):
+        if generation != self.generation:
+            return
+        self.__users[username] = (time.monotonic() + self.ttl, user)
+        self.__users.move_to_end(username)
+        while len(self.__users) > self.max_size:
+            self.__users.popitem(last=False)
+
+    def invalidate(self, username: Union[str, None] = None):
+        self.generation += 1
+        if username is None:
+            self.__users.clear()
+        else:
+            self.__users.pop(username, None)
+
+    def start(self, db):
+        self.__poll_task = asyncio.create_task(self.__poll_version(db))
+
+    async def close(self):
+        if self.__poll_task is not None:
+            self.__poll_task.cancel()
+            self.__poll_task = None
+        self.invalidate()
+
+    async def __poll_version(self, db):
+        while True:
+            try:
+                version = await db.get_users_version()
+                if version != self.__version:
+                    self.__version = version
+                    self.invalidate()
+            except Exception:
+                self.invalidate()
+            await asyncio.sleep(self.version_poll_interval)
+
+
+user_cache = UserCache(
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+    version_poll_interval=settings.USER_CACHE_VERSION_POLL_INTERVAL
+)
@@ -1,27 +1,78 @@
 import asyncio
+import shutil
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
-from api import users, admins, default
+from api import users, admins, default, jobs
+from api.jobs import job_runner
 from config import get_settings
-from database.database import AsyncMongoClient
+from database.audit_writer import audit_writer
+from database.database import AsyncMongoClient, mongo_connection
+from database.job_events import job_events
+from database.user_cache import user_cache
+from metrics import MetricsMiddleware, metrics_exchange
+from telegram.client_pool import client_pool
+from telegram.dialog_snapshot import dialog_snapshot
+from telegram.session_leases import session_leases, SessionOwnedElsewhereError
+from telegram.warm_start import warm_start
 
 settings = get_settings()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = AsyncMongoClient(client=mongo_connection.open())
+    await db.create_indexes()
+    user_cache.start(db=db)
+    audit_writer.start(db=db)
+    session_leases.start(db=db)
+    dialog_snapshot.start(db=db)
+    client_pool.client_hooks.append(dialog_snapshot.attach)
+    client_pool.start()
+    warm_start.start(db=db)
+    job_events.start(db=db)
+    job_runner.start(db=db)
+    metrics_exchange.start()
+    yield
+    await metrics_exchange.close()
+    await job_runner.close()
+    await job_events.close()
+    await warm_start.close()
+    await dialog_snapshot.close()
+    await client_pool.close()
+    await session_leases.close()
+    await audit_writer.close()
+    await user_cache.close()
+    mongo_connection.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(SessionOwnedElsewhereError)
+async def session_owned_elsewhere_handler(request: Request, ex: SessionOwnedElsewhereError) -> JSONResponse:
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": f"{ex}"},
+                        headers={"Retry-After": f"{int(ex.retry_after)}"})
+
 app.include_router(router=default.router)
 app.include_router(router=users.router)
+app.include_router(router=jobs.router)
 app.include_router(router=admins.router)
 
 
 async def main():
     db = AsyncMongoClient()
     await db.create_admin()
+    mongo_connection.close()
     if settings.DEBUG:
         uvicorn.run(app="main:app", reload=True, proxy_headers=True, host="0.0.0.0", port=8000)
     else:
-        uvicorn.run(app="main:app", proxy_headers=True, host="0.0.0.0", port=8000, workers=4)
+        if metrics_exchange.enabled:
+            # counters of a previous run would be added to the new ones
+            shutil.rmtree(metrics_exchange.directory, ignore_errors=True)
+        uvicorn.run(app="main:app", proxy_headers=True, host="0.0.0.0", port=8000, workers=settings.WEB_WORKERS)
 
 if __name__ == "__main__":
     asyncio.run(main())
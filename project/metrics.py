@@ -0,0 +1,319 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple, Callable, Union, Iterable
+
+from config import get_settings, get_worker_id
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+def format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def merge_values(snapshots: Iterable[list]) -> Dict[Labels, Union[float, List[float]]]:
+    """Sums counter values or histogram series of several workers by labels."""
+    merged = {}
+    for snapshot in snapshots:
+        for labels, value in snapshot:
+            labels = tuple(labels)
+            current = merged.get(labels)
+            if current is None:
+                merged[labels] = value
+            elif isinstance(value, list):
+                merged[labels] = [total + count for total, count in zip(current, value)]
+            else:
+                merged[labels] = current + value
+    return merged
+
+
+class Counter:
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + value
+
+    def render(self, values: Union[Dict[Labels, float], None] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in (self.values if values is None else values).items():
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = [0.0] * (len(self.buckets) + 3)
+            self.values[labels] = series
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, values: Union[Dict[Labels, List[float]], None] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in (self.values if values is None else values).items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+
+    def __init__(self, name: str, description: str, callback: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def render(self, values: Union[Dict[str, float], None] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        if values is None:
+            lines.append(f"{self.name} {float(self.callback())}")
+            return lines
+        for worker, value in values.items():
+            lines.append(f"{self.name}{format_labels(('worker',), (worker,))} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process local metrics in Prometheus text format; observing is a dict lookup and a couple of additions.
+    Rendered from snapshots of all workers, counters and histograms are summed and gauges labeled by worker."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Union[Counter, Histogram, Gauge]] = {}
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.__register(Counter(name=name, description=description, label_names=label_names))
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name=name, description=description, label_names=label_names,
+                                         buckets=buckets))
+
+    def gauge(self, name: str, description: str, callback: Callable[[], float]) -> Gauge:
+        return self.__register(Gauge(name=name, description=description, callback=callback))
+
+    def snapshot(self) -> dict:
+        result = {}
+        for metric in self.metrics.values():
+            try:
+                if isinstance(metric, Gauge):
+                    result[metric.name] = float(metric.callback())
+                else:
+                    result[metric.name] = [[list(labels), value] for labels, value in metric.values.items()]
+            except Exception:
+                continue
+        return result
+
+    def render(self, snapshots: Union[Dict[str, dict], None] = None) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                if snapshots is None:
+                    lines.extend(metric.render())
+                elif isinstance(metric, Gauge):
+                    lines.extend(metric.render({worker: snapshot[metric.name] for worker, snapshot in snapshots.items()
+                                                if metric.name in snapshot}))
+                else:
+                    lines.extend(metric.render(merge_values(snapshot.get(metric.name, [])
+                                                            for snapshot in snapshots.values())))
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+    def __register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+
+class MetricsExchange:
+    """Shares metrics between the worker processes of one server through a directory, so a scrape answered by any
+    of them covers all. Every worker replaces its own snapshot file each interval; files of exited workers keep
+    their counters, their gauges are dropped once the file is older than three intervals."""
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float, worker: str):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.worker = worker
+        self.__task: Union[asyncio.Task, None] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def start(self):
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            self.__task = asyncio.create_task(self.__write_periodically())
+
+    async def close(self):
+        if self.__task is None:
+            return
+        self.__task.cancel()
+        await asyncio.gather(self.__task, return_exceptions=True)
+        self.__task = None
+        self.write()
+
+    def write(self):
+        path = os.path.join(self.directory, f"{self.worker.replace(':', '_')}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"worker": self.worker, "metrics": self.registry.snapshot()}, file)
+        os.replace(f"{path}.tmp", path)
+
+    def snapshots(self) -> Dict[str, dict]:
+        if not self.enabled:
+            return {self.worker: self.registry.snapshot()}
+        result = {}
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                written_at = os.path.getmtime(path)
+                with open(path) as file:
+                    document = json.load(file)
+            except (OSError, ValueError):
+                continue
+            metrics = document["metrics"]
+            if now - written_at > 3 * self.interval:
+                metrics = {metric: value for metric, value in metrics.items()
+                           if not isinstance(self.registry.metrics.get(metric), Gauge)}
+            result[document["worker"]] = metrics
+        # the file of this worker is up to an interval old
+        result[self.worker] = self.registry.snapshot()
+        return result
+
+    def render(self) -> str:
+        return self.registry.render(self.snapshots() if self.enabled else None)
+
+    async def __write_periodically(self):
+        while True:
+            try:
+                self.write()
+            except Exception as ex:
+                logger.error(f"cannot write metrics of worker {self.worker}: {ex}")
+            await asyncio.sleep(self.interval)
+
+
+registry = MetricsRegistry()
+
+metrics_exchange = MetricsExchange(registry=registry, directory=settings.METRICS_MULTIPROC_DIR,
+                                   interval=settings.METRICS_WRITE_INTERVAL, worker=get_worker_id())
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+)
+telegram_request_duration = registry.histogram(
+    "telegram_request_duration_seconds", "Telegram RPC latency by request type", ("request",)
+)
+telegram_request_errors = registry.counter(
+    "telegram_request_errors_total", "Failed Telegram RPCs by request type and error", ("request", "error")
+)
+mongo_operation_duration = registry.histogram(
+    "mongo_operation_duration_seconds", "AsyncMongoClient method latency", ("method",)
+)
+mongo_operation_errors = registry.counter(
+    "mongo_operation_errors_total", "Failed AsyncMongoClient methods by error", ("method", "error")
+)
+
+
+def timed_methods(histogram: Histogram, errors: Counter):
+    def decorate(cls):
+        for name, value in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(value):
+                continue
+            setattr(cls, name, timed(value, histogram=histogram, errors=errors, label=name))
+        return cls
+    return decorate
+
+
+def timed(function, histogram: Histogram, errors: Counter, label: str):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except Exception as ex:
+            errors.inc(label, type(ex).__name__)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, label)
+    return wrapper
+
+
+# called with method, route and seconds after every http request
+request_observers: List[Callable[[str, str, float], None]] = []
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            elapsed = time.perf_counter() - start
+            http_request_duration.observe(elapsed, scope["method"], path)
+            http_requests.inc(scope["method"], path, str(status_code[0]))
+            for observer in request_observers:
+                observer(scope["method"], path, elapsed)
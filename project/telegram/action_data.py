@@ -0,0 +1,37 @@
+import zlib
+from typing import List
+
+import bson
+from bson import Binary
+from telethon import utils
+from telethon.tl.types import Message
+
+from config import get_settings
+
+settings = get_settings()
+
+
+def compact_message(message: Message) -> dict:
+    return {
+        "message_id": message.id,
+        "peer_id": utils.get_peer_id(message.peer_id) if message.peer_id is not None else None,
+        "date": message.date,
+        "grouped_id": message.grouped_id,
+        "media": type(message.media).__name__ if message.media is not None else None,
+    }
+
+
+def messages_action_data(messages: List[Message]) -> dict:
+    """Audit data of sent messages: ids and peers we query, full telethon dicts only if ACTIONS_STORE_RAW."""
+    action_data = {"messages": [compact_message(message) for message in messages]}
+    if settings.ACTIONS_STORE_RAW:
+        action_data["raw"] = compress_raw([message.to_dict() for message in messages])
+    return action_data
+
+
+def compress_raw(payload: list) -> Binary:
+    return Binary(zlib.compress(bson.encode({"payload": payload}), settings.ACTIONS_RAW_COMPRESSION_LEVEL))
+
+
+def decompress_raw(raw: bytes) -> list:
+    return bson.decode(zlib.decompress(raw))["payload"]
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Callable, Awaitable, AsyncIterator, Union, List
+
+from telethon import TelegramClient
+
+from config import get_settings
+from database.database import AsyncMongoClient
+from database.models import SessionDbModel
+from metrics import registry
+from telegram.mongo_session import MongoSession
+from telegram.session_leases import SessionLeaseManager, session_leases
+from telegram.telegram_client import TelegramAccount
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+async def create_telegram_client(session_id: str, session: SessionDbModel) -> TelegramClient:
+    mongo_session = None
+    if settings.TELEGRAM_SESSION_STORAGE == "mongo":
+        mongo_session = await MongoSession.load(session_id=session_id, db=AsyncMongoClient(),
+                                                session_file_name=session.session_file_name)
+    return await TelegramAccount(session_file_name=session.session_file_name,
+                                 app_id=session.telegram_api_id,
+                                 app_hash=session.telegram_api_hash,
+                                 session=mongo_session).get_client()
+
+
+class PooledClient:
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.client: Union[TelegramClient, None] = None
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+class TelegramClientPool:
+    """Keeps connected telegram clients alive between requests, one client per session."""
+
+    def __init__(self, max_size: int, idle_ttl: float, health_check_interval: float,
+                 leases: SessionLeaseManager):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.health_check_interval = health_check_interval
+        self.client_factory: Callable[[str, SessionDbModel], Awaitable[TelegramClient]] = create_telegram_client
+        self.client_hooks: List[Callable[[str, TelegramClient], Awaitable]] = []
+        self.leases = leases
+        self.__clients: Dict[str, PooledClient] = {}
+        self.__condition: Union[asyncio.Condition, None] = None
+        self.__reaper_task: Union[asyncio.Task, None] = None
+
+    def start(self):
+        self.__condition = asyncio.Condition()
+        self.leases.on_lost = self.drop
+        self.__reaper_task = asyncio.create_task(self.__reaper())
+
+    async def close(self):
+        if self.__reaper_task is not None:
+            self.__reaper_task.cancel()
+            self.__reaper_task = None
+        pooled_clients = list(self.__clients.values())
+        self.__clients.clear()
+        await asyncio.gather(*[self.__disconnect(pooled) for pooled in pooled_clients])
+
+    async def acquire(self, session_id: str, session: SessionDbModel) -> TelegramClient:
+        if self.__condition is None:
+            self.start()
+        async with self.__condition:
+            while True:
+                pooled = self.__clients.get(session_id)
+                if pooled is not None:
+                    break
+                if len(self.__clients) < self.max_size:
+                    pooled = PooledClient(session_id=session_id)
+                    self.__clients[session_id] = pooled
+                    break
+                if not self.__evict_least_recently_used():
+                    await self.__condition.wait()
+            pooled.leases += 1
+            pooled.last_used = time.monotonic()
+        try:
+            await self.__ensure_connected(pooled=pooled, session=session)
+        except Exception:
+            await self.release(session_id=session_id)
+            if pooled.client is None and await self.__remove(pooled):
+                await self.leases.release(session_id)
+            raise
+        return pooled.client
+
+    async def release(self, session_id: str):
+        pooled = self.__clients.get(session_id)
+        if pooled is None:
+            return
+        async with self.__condition:
+            pooled.leases = max(pooled.leases - 1, 0)
+            pooled.last_used = time.monotonic()
+            self.__condition.notify_all()
+
+    async def drop(self, session_id: str):
+        pooled = self.__clients.pop(session_id, None)
+        if pooled is not None:
+            await self.__disconnect(pooled)
+        if self.__condition is not None:
+            async with self.__condition:
+                self.__condition.notify_all()
+
+    @asynccontextmanager
+    async def lease(self, session_id: str, session: SessionDbModel) -> AsyncIterator[TelegramClient]:
+        client = await self.acquire(session_id=session_id, session=session)
+        try:
+            yield client
+        finally:
+            await self.release(session_id=session_id)
+
+    def stats(self) -> dict:
+        leased = len([pooled for pooled in self.__clients.values() if pooled.leases > 0])
+        connected = len([pooled for pooled in self.__clients.values()
+                         if pooled.client is not None and pooled.client.is_connected()])
+        return {
+            "max_size": self.max_size,
+            "idle_ttl": self.idle_ttl,
+            "size": len(self.__clients),
+            "connected": connected,
+            "leased": leased,
+            "idle": len(self.__clients) - leased,
+        }
+
+    async def __ensure_connected(self, pooled: PooledClient, session: SessionDbModel):
+        async with pooled.lock:
+            if pooled.client is None:
+                await self.leases.acquire(pooled.session_id)
+                pooled.client = await self.client_factory(pooled.session_id, session)
+                for hook in self.client_hooks:
+                    try:
+                        await hook(pooled.session_id, pooled.client)
+                    except Exception as ex:
+                        logger.error(f"client hook failed for session {pooled.session_id}: {ex}")
+            elif not pooled.client.is_connected():
+                await pooled.client.connect()
+
+    def __evict_least_recently_used(self) -> bool:
+        idle = [pooled for pooled in self.__clients.values() if pooled.leases == 0]
+        if not idle:
+            return False
+        pooled = min(idle, key=lambda item: item.last_used)
+        del self.__clients[pooled.session_id]
+        asyncio.create_task(self.__disconnect(pooled))
+        return True
+
+    async def __remove(self, pooled: PooledClient) -> bool:
+        async with self.__condition:
+            if pooled.leases > 0 or self.__clients.get(pooled.session_id) is not pooled:
+                return False
+            del self.__clients[pooled.session_id]
+            self.__condition.notify_all()
+            return True
+
+    async def __disconnect(self, pooled: PooledClient):
+        if pooled.client is None:
+            return
+        try:
+            await pooled.client.disconnect()
+            if isinstance(pooled.client.session, MongoSession):
+                await pooled.client.session.flush()
+        except Exception:
+            pass
+        await self.leases.release(pooled.session_id)
+
+    async def __reaper(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for session_id in self.leases.held - set(self.__clients):
+                await self.leases.release(session_id)
+            now = time.monotonic()
+            for pooled in list(self.__clients.values()):
+                if pooled.leases > 0:
+                    continue
+                if now - pooled.last_used > self.idle_ttl:
+                    if await self.__remove(pooled):
+                        await self.__disconnect(pooled)
+                elif pooled.client is not None and not pooled.client.is_connected():
+                    try:
+                        async with pooled.lock:
+                            await pooled.client.connect()
+                    except Exception:
+                        if await self.__remove(pooled):
+                            await self.__disconnect(pooled)
+
+
+client_pool = TelegramClientPool(
+    max_size=settings.TELEGRAM_POOL_MAX_SIZE,
+    idle_ttl=settings.TELEGRAM_POOL_IDLE_TTL,
+    health_check_interval=settings.TELEGRAM_POOL_HEALTH_CHECK_INTERVAL,
+    leases=session_leases
+)
+
+registry.gauge("telegram_pool_clients", "Telegram clients kept in the pool", lambda: client_pool.stats()["size"])
+registry.gauge("telegram_pool_connected_clients", "Connected telegram clients in the pool",
+               lambda: client_pool.stats()["connected"])
+registry.gauge("telegram_pool_leased_clients", "Pooled telegram clients used by requests",
+               lambda: client_pool.stats()["leased"])
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Dict, List, Union
+
+from telethon import TelegramClient, events, utils
+
+from database.database import AsyncMongoClient
+from database.models import DialogDbModel
+from telegram.entity_cache import entity_to_db_model, DIALOGS_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class DialogSnapshot:
+    """Per session dialog list in Mongo, built from iter_dialogs whenever a client is attached and then kept current
+    by update events. Versions are allocated before the dialogs carrying them are written and committed after, under
+    the session lock, so readers that stop at the committed version never skip a write still in flight."""
+
+    def __init__(self):
+        self.events = 0
+        self.syncs = 0
+        self.__db: Union[AsyncMongoClient, None] = None
+        self.__locks: Dict[str, asyncio.Lock] = {}
+        self.__sync_tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, db: AsyncMongoClient):
+        self.__db = db
+
+    async def close(self):
+        for task in self.__sync_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.__sync_tasks.values(), return_exceptions=True)
+        self.__sync_tasks.clear()
+
+    async def attach(self, session_id: str, client: TelegramClient):
+        if self.__db is None:
+            return
+        client.add_event_handler(lambda event: self.__on_new_message(session_id, event), events.NewMessage())
+        client.add_event_handler(lambda event: self.__on_message_read(session_id, event),
+                                 events.MessageRead(inbox=True))
+        client.add_event_handler(lambda event: self.__on_chat_action(session_id, event), events.ChatAction())
+        state = await self.__db.get_dialog_snapshot_state(session_id=session_id)
+        if state is not None and state.get("synced_at") is not None:
+            # the pool creates a client only on first use or after the previous one was dropped, so a synced
+            # snapshot predates that disconnect and misses every update received meanwhile
+            await self.__db.mark_dialog_snapshot_stale(session_id=session_id)
+        self.request_sync(session_id=session_id, client=client)
+
+    def request_sync(self, session_id: str, client: TelegramClient) -> asyncio.Task:
+        task = self.__sync_tasks.get(session_id)
+        if task is None:
+            task = asyncio.create_task(self.sync(session_id=session_id, client=client))
+            self.__sync_tasks[session_id] = task
+        return task
+
+    async def sync(self, session_id: str, client: TelegramClient):
+        try:
+            batch: List[DialogDbModel] = []
+            async for dialog in client.iter_dialogs():
+                entity = entity_to_db_model(session_id=session_id, entity=dialog.entity)
+                if entity is None:
+                    continue
+                batch.append(DialogDbModel(
+                    session_id=session_id,
+                    peer_id=dialog.id,
+                    title=dialog.title or "",
+                    type=entity.peer_type,
+                    unread_count=dialog.unread_count,
+                    date=dialog.date,
+                    top_message_id=dialog.message.id if dialog.message is not None else 0
+                ))
+                if len(batch) >= DIALOGS_BATCH_SIZE:
+                    await self.__save_batch(session_id=session_id, batch=batch)
+                    batch = []
+            await self.__save_batch(session_id=session_id, batch=batch)
+            await self.__db.mark_dialog_snapshot_synced(session_id=session_id)
+            self.syncs += 1
+        except Exception as ex:
+            logger.error(f"cannot build dialog snapshot of session {session_id}: {ex}")
+        finally:
+            self.__sync_tasks.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "syncs": self.syncs,
+            "syncing": len(self.__sync_tasks),
+        }
+
+    async def __save_batch(self, session_id: str, batch: List[DialogDbModel]):
+        if not batch:
+            return
+        async with self.__lock(session_id):
+            last_version = await self.__db.allocate_dialog_versions(session_id=session_id, count=len(batch))
+            for offset, dialog in enumerate(batch):
+                dialog.version = last_version - len(batch) + offset + 1
+            await self.__db.save_dialogs(batch)
+            await self.__db.commit_dialog_versions(session_id=session_id, version=last_version)
+
+    async def __update(self, session_id: str, peer_id: int, changes: dict, unread_increment: int = 0,
+                       defaults: Union[DialogDbModel, None] = None, max_read_id: Union[int, None] = None):
+        self.events += 1
+        try:
+            async with self.__lock(session_id):
+                version = await self.__db.allocate_dialog_versions(session_id=session_id)
+                await self.__db.update_dialog(
+                    session_id=session_id, peer_id=peer_id, version=version, changes=changes,
+                    unread_increment=unread_increment, max_read_id=max_read_id,
+                    defaults=defaults.model_dump() if defaults is not None else None
+                )
+                await self.__db.commit_dialog_versions(session_id=session_id, version=version)
+        except Exception as ex:
+            logger.error(f"cannot update dialog {peer_id} of session {session_id}: {ex}")
+
+    async def __on_new_message(self, session_id: str, event: events.NewMessage.Event):
+        chat = await event.get_chat()
+        entity = entity_to_db_model(session_id=session_id, entity=chat)
+        if entity is None:
+            return
+        title = utils.get_display_name(chat) or ""
+        await self.__update(
+            session_id=session_id, peer_id=event.chat_id,
+            changes={"title": title, "date": event.message.date, "top_message_id": event.message.id,
+                     "deleted": False},
+            unread_increment=0 if event.out else 1,
+            defaults=DialogDbModel(session_id=session_id, peer_id=event.chat_id, title=title, type=entity.peer_type)
+        )
+
+    async def __on_message_read(self, session_id: str, event: events.MessageRead.Event):
+        await self.__update(session_id=session_id, peer_id=event.chat_id, changes={"unread_count": 0},
+                            max_read_id=event.max_id)
+
+    async def __on_chat_action(self, session_id: str, event: events.ChatAction.Event):
+        if event.new_title:
+            await self.__update(session_id=session_id, peer_id=event.chat_id, changes={"title": event.new_title})
+        elif (event.user_left or event.user_kicked) and event.user_id == await event.client.get_peer_id("me"):
+            await self.__update(session_id=session_id, peer_id=event.chat_id, changes={"deleted": True})
+
+    def __lock(self, session_id: str) -> asyncio.Lock:
+        lock = self.__locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.__locks[session_id] = lock
+        return lock
+
+
+dialog_snapshot = DialogSnapshot()
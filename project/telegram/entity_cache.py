@@ -0,0 +1,113 @@
+from typing import Union, List
+
+from telethon import TelegramClient, utils
+from telethon.tl.types import (User, Chat, Channel, InputPeerUser, InputPeerChat, InputPeerChannel,
+                               InputChannel, TypeInputPeer)
+
+from database.database import AsyncMongoClient
+from database.models import EntityDbModel, PeerTypeEnum
+
+DIALOGS_BATCH_SIZE = 100
+
+
+def entity_to_db_model(session_id: str, entity) -> Union[EntityDbModel, None]:
+    if isinstance(entity, User):
+        peer_type = PeerTypeEnum.user
+    elif isinstance(entity, Chat):
+        peer_type = PeerTypeEnum.chat
+    elif isinstance(entity, Channel):
+        peer_type = PeerTypeEnum.channel
+    else:
+        return None
+    username = getattr(entity, "username", None)
+    return EntityDbModel(
+        session_id=session_id,
+        peer_id=utils.get_peer_id(entity),
+        entity_id=entity.id,
+        peer_type=peer_type,
+        access_hash=getattr(entity, "access_hash", None) or 0,
+        username=username.lower() if username else None,
+        phone=getattr(entity, "phone", None),
+        name=utils.get_display_name(entity) or None
+    )
+
+
+def get_input_peer(entity: EntityDbModel) -> TypeInputPeer:
+    if entity.peer_type == PeerTypeEnum.user:
+        return InputPeerUser(user_id=entity.entity_id, access_hash=entity.access_hash)
+    elif entity.peer_type == PeerTypeEnum.chat:
+        return InputPeerChat(chat_id=entity.entity_id)
+    else:
+        return InputPeerChannel(channel_id=entity.entity_id, access_hash=entity.access_hash)
+
+
+def get_input_channel(entity: EntityDbModel) -> InputChannel:
+    return InputChannel(channel_id=entity.entity_id, access_hash=entity.access_hash)
+
+
+class EntityCache:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, db: AsyncMongoClient, client: TelegramClient, session_id: str, peer) -> EntityDbModel:
+        username, peer_id = None, None
+        if isinstance(peer, str):
+            username, is_invite = utils.parse_username(peer)
+            if username is None or is_invite:
+                raise ValueError(f"cannot resolve {peer}")
+            entity = await db.get_cached_entity(session_id=session_id, username=username)
+        else:
+            peer_id = utils.get_peer_id(peer)
+            entity = await db.get_cached_entity(session_id=session_id, peer_id=peer_id)
+        if entity is not None:
+            self.hits += 1
+            return entity
+
+        self.misses += 1
+        try:
+            entity = entity_to_db_model(session_id=session_id, entity=await client.get_entity(username or peer_id))
+            if entity is not None:
+                await db.save_cached_entities([entity])
+                return entity
+        except ValueError:
+            pass
+        entity = await self.__fill_from_dialogs(db=db, client=client, session_id=session_id,
+                                                peer_id=peer_id, username=username)
+        if entity is None:
+            raise ValueError(f"cannot find entity {peer}")
+        return entity
+
+    async def get_input_entity(self, db: AsyncMongoClient, client: TelegramClient,
+                               session_id: str, peer) -> TypeInputPeer:
+        return get_input_peer(await self.resolve(db=db, client=client, session_id=session_id, peer=peer))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    async def __fill_from_dialogs(self, db: AsyncMongoClient, client: TelegramClient, session_id: str,
+                                  peer_id: Union[int, None], username: Union[str, None]) -> Union[EntityDbModel, None]:
+        found = None
+        batch: List[EntityDbModel] = []
+        async for dialog in client.iter_dialogs():
+            entity = entity_to_db_model(session_id=session_id, entity=dialog.entity)
+            if entity is None:
+                continue
+            batch.append(entity)
+            if entity.peer_id == peer_id or (username is not None and entity.username == username):
+                found = entity
+                break
+            if len(batch) >= DIALOGS_BATCH_SIZE:
+                await db.save_cached_entities(batch)
+                batch = []
+        await db.save_cached_entities(batch)
+        return found
+
+
+entity_cache = EntityCache()
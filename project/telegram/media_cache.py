@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import List, Dict, Callable, Awaitable, Union, Optional
+
+from fastapi import UploadFile
+from telethon import TelegramClient
+from telethon.errors import FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError
+from telethon.tl.types import Message, MessageMediaPhoto, MessageMediaDocument, InputPhoto, InputDocument, Photo, \
+    Document
+
+from database.database import AsyncMongoClient
+from database.models import CachedMediaDbModel, CachedMediaTypeEnum, UploadStatusEnum
+from metrics import registry
+from telegram.upload_progress import UploadProgress
+from telegram.uploads import upload_stream, upload_sha256, get_upload_size
+
+logger = logging.getLogger(__name__)
+
+STALE_REFERENCE_ERRORS = (FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError)
+
+
+def cached_to_input_media(media: CachedMediaDbModel) -> Union[InputPhoto, InputDocument]:
+    if media.media_type == CachedMediaTypeEnum.photo:
+        return InputPhoto(id=media.media_id, access_hash=media.access_hash, file_reference=media.file_reference)
+    return InputDocument(id=media.media_id, access_hash=media.access_hash, file_reference=media.file_reference)
+
+
+def message_to_cached_media(session_id: str, sha256: str, size: int,
+                            message: Message) -> Union[CachedMediaDbModel, None]:
+    if isinstance(message.media, MessageMediaPhoto) and isinstance(message.media.photo, Photo):
+        media, media_type = message.media.photo, CachedMediaTypeEnum.photo
+    elif isinstance(message.media, MessageMediaDocument) and isinstance(message.media.document, Document):
+        media, media_type = message.media.document, CachedMediaTypeEnum.document
+    else:
+        return None
+    return CachedMediaDbModel(session_id=session_id, sha256=sha256, media_type=media_type, media_id=media.id,
+                              access_hash=media.access_hash, file_reference=media.file_reference, size=size)
+
+
+class PreparedMedia:
+    """Files of one request with their hashes; cached references and fresh uploads are shared by its sends."""
+
+    def __init__(self, session_id: str, upload_files: List[UploadFile], digests: List[str],
+                 cached: Dict[str, CachedMediaDbModel], progress: Optional[UploadProgress] = None):
+        self.session_id = session_id
+        self.upload_files = upload_files
+        self.digests = digests
+        self.sizes = [get_upload_size(upload_file) for upload_file in upload_files]
+        self.references: Dict[int, CachedMediaDbModel] = {
+            index: cached[digest] for index, digest in enumerate(digests) if digest in cached
+        }
+        self.uploads: Dict[int, object] = {}
+        self.unsent: set = set()
+        self.progress = progress
+        self.lock = asyncio.Lock()
+
+
+class MediaCache:
+    """Sent photo and document references per session and content hash, so repeated media is not uploaded again."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.uploaded_bytes = 0
+        self.saved_bytes = 0
+
+    async def prepare(self, db: AsyncMongoClient, session_id: str, upload_files: List[UploadFile],
+                      progress: Optional[UploadProgress] = None) -> PreparedMedia:
+        digests = list(await asyncio.gather(*[upload_sha256(upload_file) for upload_file in upload_files]))
+        cached = await db.get_cached_media(session_id=session_id, digests=list(set(digests)))
+        prepared = PreparedMedia(session_id=session_id, upload_files=upload_files, digests=digests, cached=cached,
+                                 progress=progress)
+        if progress is not None:
+            await progress.start(cached=prepared.references.keys())
+        return prepared
+
+    async def send(self, db: AsyncMongoClient, client: TelegramClient, prepared: PreparedMedia,
+                   send: Callable[[list], Awaitable[List[Message]]]) -> List[Message]:
+        for attempt in range(2):
+            files, reused = await self.__input_files(client=client, prepared=prepared)
+            try:
+                result = await send(files)
+            except STALE_REFERENCE_ERRORS:
+                stale = [index for index in reused if index in prepared.references]
+                if attempt > 0 or not stale:
+                    raise
+                self.stale += 1
+                for index in stale:
+                    prepared.references.pop(index, None)
+                await db.delete_cached_media(session_id=prepared.session_id,
+                                             digests=[prepared.digests[index] for index in stale])
+                continue
+            self.hits += len(reused)
+            self.saved_bytes += sum(prepared.sizes[index] for index in reused)
+            await self.__remember(db=db, prepared=prepared, messages=result)
+            return result
+
+    async def upload(self, client: TelegramClient, prepared: PreparedMedia):
+        """Upload files without a cached reference now, while the request files are still open."""
+        async with prepared.lock:
+            for index in range(len(prepared.upload_files)):
+                if index not in prepared.references and index not in prepared.uploads:
+                    prepared.uploads[index] = await self.__upload(client=client, prepared=prepared, index=index)
+                    prepared.unsent.add(index)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / total if total else 0.0,
+            "uploaded_bytes": self.uploaded_bytes,
+            "saved_bytes": self.saved_bytes,
+        }
+
+    async def __input_files(self, client: TelegramClient, prepared: PreparedMedia) -> tuple:
+        files, reused = [], []
+        async with prepared.lock:
+            for index, upload_file in enumerate(prepared.upload_files):
+                reference = prepared.references.get(index)
+                if reference is not None:
+                    files.append(cached_to_input_media(reference))
+                    reused.append(index)
+                elif index in prepared.uploads:
+                    files.append(prepared.uploads[index])
+                    if index in prepared.unsent:
+                        prepared.unsent.discard(index)
+                    else:
+                        reused.append(index)
+                else:
+                    prepared.uploads[index] = await self.__upload(client=client, prepared=prepared, index=index)
+                    files.append(prepared.uploads[index])
+        return files, reused
+
+    async def __upload(self, client: TelegramClient, prepared: PreparedMedia, index: int):
+        self.misses += 1
+        self.uploaded_bytes += prepared.sizes[index]
+        progress = prepared.progress
+        if progress is None:
+            return await upload_stream(client=client, upload_file=prepared.upload_files[index])
+        try:
+            uploaded = await upload_stream(client=client, upload_file=prepared.upload_files[index],
+                                           on_progress=progress.callback(index))
+        except Exception:
+            await progress.finish(index, UploadStatusEnum.failed)
+            raise
+        await progress.finish(index, UploadStatusEnum.done)
+        return uploaded
+
+    async def __remember(self, db: AsyncMongoClient, prepared: PreparedMedia, messages: List[Message]):
+        learned = []
+        for index, message in enumerate(messages[:len(prepared.upload_files)]):
+            if index in prepared.references:
+                continue
+            media = message_to_cached_media(session_id=prepared.session_id, sha256=prepared.digests[index],
+                                            size=prepared.sizes[index], message=message)
+            if media is not None:
+                prepared.references[index] = media
+                learned.append(media)
+        try:
+            await db.save_cached_media(learned)
+        except Exception as ex:
+            logger.error(f"cannot cache media of session {prepared.session_id}: {ex}")
+
+
+media_cache = MediaCache()
+
+registry.gauge("media_cache_hits", "Files sent from a cached telegram reference", lambda: media_cache.hits)
+registry.gauge("media_cache_misses", "Files uploaded to telegram", lambda: media_cache.misses)
+registry.gauge("media_cache_saved_bytes", "Upload bytes saved by the media cache", lambda: media_cache.saved_bytes)
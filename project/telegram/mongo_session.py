@@ -0,0 +1,158 @@
+import asyncio
+import os
+import sqlite3
+from typing import Dict, List, Tuple, Union
+
+from telethon import utils
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.tl.types import PeerUser, PeerChat, PeerChannel
+
+from config import get_settings
+from database.database import AsyncMongoClient
+from database.models import EntityDbModel, PeerTypeEnum
+
+settings = get_settings()
+
+EntityRow = Tuple[int, int, Union[str, None], Union[str, None], Union[str, None]]
+
+
+def row_to_entity(session_id: str, row: EntityRow) -> EntityDbModel:
+    marked_id, access_hash, username, phone, name = row
+    entity_id, kind = utils.resolve_id(marked_id)
+    if kind == PeerUser:
+        peer_type = PeerTypeEnum.user
+    elif kind == PeerChat:
+        peer_type = PeerTypeEnum.chat
+    else:
+        peer_type = PeerTypeEnum.channel
+    return EntityDbModel(session_id=session_id, peer_id=marked_id, entity_id=entity_id, peer_type=peer_type,
+                         access_hash=access_hash, username=username, phone=phone, name=name)
+
+
+def entity_to_row(entity: EntityDbModel) -> EntityRow:
+    return entity.peer_id, entity.access_hash, entity.username, entity.phone, entity.name
+
+
+class MongoSession(MemorySession):
+    """Telethon session whose auth key, dc and entity table live in Mongo instead of a SQLite file."""
+
+    def __init__(self, session_id: str, db: AsyncMongoClient):
+        super().__init__()
+        self.session_id = session_id
+        self.__db = db
+        self.__rows: Dict[int, EntityRow] = {}
+        self.__ids_by_username: Dict[str, int] = {}
+        self.__pending_rows: Dict[int, EntityRow] = {}
+        self.__state_changed = False
+        self.__flush_lock = asyncio.Lock()
+        self.__flush_task: Union[asyncio.Task, None] = None
+
+    @classmethod
+    async def load(cls, session_id: str, db: AsyncMongoClient,
+                   session_file_name: Union[str, None] = None) -> "MongoSession":
+        session = cls(session_id=session_id, db=db)
+        state = await db.get_telethon_session(session_id=session_id)
+        if state is not None:
+            session._dc_id = state["dc_id"]
+            session._server_address = state["server_address"]
+            session._port = state["port"]
+            session._auth_key = AuthKey(data=state["auth_key"]) if state.get("auth_key") else None
+            session._takeout_id = state.get("takeout_id")
+            for entity in await db.get_session_entities(session_id=session_id):
+                session.__add_row(entity_to_row(entity))
+        elif session_file_name is not None and os.path.exists(f"sessions/{session_file_name}"):
+            session.import_sqlite(f"sessions/{session_file_name}")
+            await session.flush()
+        return session
+
+    def import_sqlite(self, path: str):
+        sqlite_session = SQLiteSession(path)
+        self.set_dc(sqlite_session.dc_id, sqlite_session.server_address, sqlite_session.port)
+        self.auth_key = sqlite_session.auth_key
+        self.takeout_id = sqlite_session.takeout_id
+        sqlite_session.close()
+        connection = sqlite3.connect(path)
+        try:
+            for row in connection.execute("select id, hash, username, phone, name from entities"):
+                self.__add_row(row)
+                self.__pending_rows[row[0]] = row
+        finally:
+            connection.close()
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self.__state_changed = True
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self.__state_changed = True
+        self.__schedule_flush()
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self.__state_changed = True
+
+    def process_entities(self, tlo):
+        for row in self._entities_to_rows(tlo):
+            if self.__rows.get(row[0]) != row:
+                self.__add_row(row)
+                self.__pending_rows[row[0]] = row
+        if len(self.__pending_rows) >= settings.TELEGRAM_SESSION_ENTITY_BATCH_SIZE:
+            self.__schedule_flush()
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        ids = [id] if exact else [utils.get_peer_id(PeerUser(id)), utils.get_peer_id(PeerChat(id)),
+                                  utils.get_peer_id(PeerChannel(id))]
+        for marked_id in ids:
+            row = self.__rows.get(marked_id)
+            if row is not None:
+                return row[0], row[1]
+
+    def get_entity_rows_by_username(self, username):
+        marked_id = self.__ids_by_username.get(username)
+        if marked_id is not None:
+            return self.get_entity_rows_by_id(marked_id)
+
+    def get_entity_rows_by_phone(self, phone):
+        return next(((row[0], row[1]) for row in self.__rows.values() if row[3] == phone), None)
+
+    def get_entity_rows_by_name(self, name):
+        return next(((row[0], row[1]) for row in self.__rows.values() if row[4] == name), None)
+
+    def save(self):
+        self.__schedule_flush()
+
+    def close(self):
+        self.__schedule_flush()
+
+    async def flush(self):
+        async with self.__flush_lock:
+            if self.__state_changed:
+                self.__state_changed = False
+                await self.__db.save_telethon_session(session_id=self.session_id, state={
+                    "dc_id": self._dc_id,
+                    "server_address": self._server_address,
+                    "port": self._port,
+                    "auth_key": self._auth_key.key if self._auth_key else None,
+                    "takeout_id": self._takeout_id,
+                })
+            if self.__pending_rows:
+                rows: List[EntityRow] = list(self.__pending_rows.values())
+                self.__pending_rows = {}
+                await self.__db.save_cached_entities([row_to_entity(self.session_id, row) for row in rows])
+
+    def __add_row(self, row: EntityRow):
+        self.__rows[row[0]] = row
+        if row[2]:
+            self.__ids_by_username[row[2]] = row[0]
+
+    def __schedule_flush(self):
+        if self.__flush_task is not None and not self.__flush_task.done():
+            return
+        try:
+            self.__flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            pass
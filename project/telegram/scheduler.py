@@ -0,0 +1,143 @@
+import asyncio
+import time
+from enum import Enum
+from typing import Dict, Tuple, Callable, Awaitable, TypeVar
+
+from telethon.errors import FloodWaitError
+
+from config import get_settings
+from metrics import registry
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+
+class RpcKind(str, Enum):
+    send = "send"
+    react = "react"
+    join = "join"
+
+
+class SchedulerBusyError(Exception):
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"session is rate limited, retry after {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        self.__refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def expected_wait(self) -> float:
+        self.__refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SessionScheduler:
+    """Per session and rpc kind token buckets; FloodWait parks queued calls until the wait expires. Calls that would
+    wait longer than max_wait or hit FloodWait more than max_flood_retries times raise SchedulerBusyError."""
+
+    def __init__(self, limits: Dict[RpcKind, Tuple[float, int]], max_wait: float, max_flood_retries: int):
+        self.limits = limits
+        self.max_wait = max_wait
+        self.max_flood_retries = max_flood_retries
+        self.flood_waits = 0
+        self.__buckets: Dict[Tuple[str, RpcKind], TokenBucket] = {}
+        self.__blocked_until: Dict[Tuple[str, RpcKind], float] = {}
+        self.__queued: Dict[Tuple[str, RpcKind], int] = {}
+
+    async def run(self, session_id: str, kind: RpcKind, operation: Callable[[], Awaitable[T]]) -> T:
+        key = (session_id, kind)
+        expected_wait = self.expected_wait(session_id=session_id, kind=kind)
+        if expected_wait > self.max_wait:
+            raise SchedulerBusyError(retry_after=expected_wait)
+        self.__queued[key] = self.__queued.get(key, 0) + 1
+        flood_retries = 0
+        try:
+            while True:
+                blocked = self.__blocked_until.get(key, 0) - time.monotonic()
+                if blocked > self.max_wait:
+                    # a FloodWait of another call parked the session for longer than a request may wait
+                    raise SchedulerBusyError(retry_after=blocked)
+                if blocked > 0:
+                    await asyncio.sleep(blocked)
+                    continue
+                delay = self.__bucket(key).reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    return await operation()
+                except FloodWaitError as ex:
+                    self.flood_waits += 1
+                    self.__blocked_until[key] = max(self.__blocked_until.get(key, 0), time.monotonic() + ex.seconds)
+                    flood_retries += 1
+                    expected_wait = self.expected_wait(session_id=session_id, kind=kind)
+                    if flood_retries > self.max_flood_retries or expected_wait > self.max_wait:
+                        raise SchedulerBusyError(retry_after=expected_wait)
+        finally:
+            self.__queued[key] -= 1
+            if self.__queued[key] == 0:
+                del self.__queued[key]
+
+    def expected_wait(self, session_id: str, kind: RpcKind) -> float:
+        key = (session_id, kind)
+        blocked = max(self.__blocked_until.get(key, 0) - time.monotonic(), 0.0)
+        return max(blocked, self.__bucket(key).expected_wait())
+
+    def status(self, session_id: str) -> dict:
+        result = {}
+        for kind in RpcKind:
+            key = (session_id, kind)
+            result[kind.value] = {
+                "queue_depth": self.__queued.get(key, 0),
+                "expected_wait": round(self.expected_wait(session_id=session_id, kind=kind), 3),
+                "flood_wait": round(max(self.__blocked_until.get(key, 0) - time.monotonic(), 0.0), 3),
+            }
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": sum(self.__queued.values()),
+            "flood_waits": self.flood_waits,
+            "blocked_sessions": len([until for until in self.__blocked_until.values() if until > time.monotonic()]),
+        }
+
+    def __bucket(self, key: Tuple[str, RpcKind]) -> TokenBucket:
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            rate, capacity = self.limits[key[1]]
+            bucket = TokenBucket(rate=rate, capacity=capacity)
+            self.__buckets[key] = bucket
+        return bucket
+
+
+scheduler = SessionScheduler(
+    limits={
+        RpcKind.send: (settings.SCHEDULER_SEND_RATE, settings.SCHEDULER_SEND_BURST),
+        RpcKind.react: (settings.SCHEDULER_REACT_RATE, settings.SCHEDULER_REACT_BURST),
+        RpcKind.join: (settings.SCHEDULER_JOIN_RATE, settings.SCHEDULER_JOIN_BURST),
+    },
+    max_wait=settings.SCHEDULER_MAX_WAIT,
+    max_flood_retries=settings.SCHEDULER_MAX_FLOOD_RETRIES
+)
+
+registry.gauge("scheduler_queue_depth", "Telegram calls waiting for a rate limit token",
+               lambda: scheduler.stats()["queue_depth"])
+registry.gauge("scheduler_blocked_sessions", "Session and rpc kinds parked by FloodWait",
+               lambda: scheduler.stats()["blocked_sessions"])
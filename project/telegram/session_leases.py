@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import Union, Set, Callable, Awaitable, List
+
+from config import get_settings, get_worker_id
+from database.database import AsyncMongoClient
+from metrics import registry
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# requests of a session owned by another worker are forwarded to it as jobs, this error only means the lease
+# changed hands in between, and a retry that lands on any worker is forwarded again
+OWNED_ELSEWHERE_RETRY_AFTER = 1
+
+
+class SessionOwnedElsewhereError(Exception):
+
+    def __init__(self, session_id: str, owner: str, retry_after: float):
+        super().__init__(f"session {session_id} is connected by worker {owner}")
+        self.session_id = session_id
+        self.owner = owner
+        self.retry_after = retry_after
+
+
+class SessionLeaseManager:
+    """Mongo leases that keep each telegram session connected from exactly one worker."""
+
+    def __init__(self, lease_seconds: float):
+        self.lease_seconds = lease_seconds
+        self.owner = get_worker_id()
+        self.lost_leases = 0
+        self.on_lost: Union[Callable[[str], Awaitable], None] = None
+        self.__db: Union[AsyncMongoClient, None] = None
+        self.__held: Set[str] = set()
+        self.__heartbeat_task: Union[asyncio.Task, None] = None
+
+    @property
+    def held(self) -> Set[str]:
+        return set(self.__held)
+
+    def start(self, db: AsyncMongoClient):
+        self.__db = db
+        self.__heartbeat_task = asyncio.create_task(self.__heartbeat())
+
+    async def close(self):
+        if self.__heartbeat_task is not None:
+            self.__heartbeat_task.cancel()
+            self.__heartbeat_task = None
+        for session_id in list(self.__held):
+            await self.release(session_id)
+
+    async def try_acquire(self, session_id: str) -> bool:
+        if session_id in self.__held:
+            return True
+        if not await self.__get_db().acquire_session_lease(session_id=session_id, owner=self.owner,
+                                                           lease_seconds=self.lease_seconds):
+            return False
+        self.__held.add(session_id)
+        return True
+
+    async def acquire(self, session_id: str):
+        if not await self.try_acquire(session_id):
+            lease = await self.__get_db().get_session_lease(session_id=session_id)
+            owner = lease["owner"] if lease else "unknown"
+            raise SessionOwnedElsewhereError(session_id=session_id, owner=owner, retry_after=OWNED_ELSEWHERE_RETRY_AFTER)
+
+    async def release(self, session_id: str):
+        if session_id not in self.__held:
+            return
+        self.__held.discard(session_id)
+        try:
+            await self.__get_db().release_session_lease(session_id=session_id, owner=self.owner)
+        except Exception as ex:
+            logger.error(f"cannot release lease of session {session_id}: {ex}")
+
+    async def foreign_sessions(self) -> List[str]:
+        return await self.__get_db().get_foreign_session_leases(owner=self.owner)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "held": len(self.__held),
+            "lost_leases": self.lost_leases,
+        }
+
+    def __get_db(self) -> AsyncMongoClient:
+        if self.__db is None:
+            self.__db = AsyncMongoClient()
+        return self.__db
+
+    async def __heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self.__held:
+                continue
+            held = list(self.__held)
+            try:
+                renewed = set(await self.__db.renew_session_leases(session_ids=held, owner=self.owner,
+                                                                    lease_seconds=self.lease_seconds))
+            except Exception as ex:
+                logger.error(f"cannot renew session leases: {ex}")
+                continue
+            for session_id in held:
+                if session_id not in renewed and session_id in self.__held:
+                    self.__held.discard(session_id)
+                    self.lost_leases += 1
+                    logger.warning(f"lease of session {session_id} was taken over by another worker")
+                    if self.on_lost is not None:
+                        await self.on_lost(session_id)
+
+
+session_leases = SessionLeaseManager(lease_seconds=settings.SESSION_LEASE_SECONDS)
+
+registry.gauge("session_leases_held", "Telegram sessions leased by this worker", lambda: session_leases.stats()["held"])
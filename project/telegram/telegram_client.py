@@ -1,14 +1,90 @@
+import asyncio
+import logging
+import time
 from pathlib import Path
+from typing import Union, List
 
 from telethon import TelegramClient
+from telethon.network import MTProtoSender
+from telethon.sessions import Session
+from telethon.tl import functions
+from telethon.tl.alltlobjects import LAYER
+
+from metrics import telegram_request_duration, telegram_request_errors
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedTelegramClient(TelegramClient):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__upload_senders: List[MTProtoSender] = []
+        self.__upload_senders_lock = asyncio.Lock()
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        name = type(request[0] if isinstance(request, list) and request else request).__name__
+        start = time.perf_counter()
+        try:
+            return await super().__call__(request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+        except Exception as ex:
+            telegram_request_errors.inc(name, type(ex).__name__)
+            raise
+        finally:
+            telegram_request_duration.observe(time.perf_counter() - start, name)
+
+    async def upload_senders(self, count: int) -> list:
+        """Up to count extra connections to the home dc for file parts, opened once and kept until disconnect;
+        the main sender when there are none."""
+        async with self.__upload_senders_lock:
+            missing = count - len(self.__upload_senders)
+            if missing > 0:
+                for sender in await asyncio.gather(*[self._connect_upload_sender() for _ in range(missing)],
+                                                   return_exceptions=True):
+                    if isinstance(sender, Exception):
+                        logger.warning(f"cannot open upload connection: {sender}")
+                    else:
+                        self.__upload_senders.append(sender)
+            return self.__upload_senders[:count] or [self._sender]
+
+    async def send_upload_part(self, sender, request) -> bool:
+        name = type(request).__name__
+        start = time.perf_counter()
+        try:
+            return await self._call(sender, request)
+        except Exception as ex:
+            telegram_request_errors.inc(name, type(ex).__name__)
+            raise
+        finally:
+            telegram_request_duration.observe(time.perf_counter() - start, name)
+
+    async def _disconnect_coro(self):
+        async with self.__upload_senders_lock:
+            senders, self.__upload_senders = self.__upload_senders, []
+        for sender in senders:
+            await sender.disconnect()
+        await super()._disconnect_coro()
+
+    async def _connect_upload_sender(self):
+        # same dc and auth key as the main sender, but its own connection: it cannot share the main seqno
+        dc = await self._get_dc(self.session.dc_id)
+        sender = MTProtoSender(self.session.auth_key, loggers=self._log)
+        await sender.connect(self._connection(dc.ip_address, dc.port, dc.id, loggers=self._log, proxy=self._proxy,
+                                              local_addr=self._local_addr))
+        self._init_request.query = functions.help.GetConfigRequest()
+        await sender.send(functions.InvokeWithLayerRequest(LAYER, self._init_request))
+        return sender
+
 
 class TelegramAccount:
 
-    def __init__(self, session_file_name: str, app_id: int, app_hash: str):
-        self.__channel_client = TelegramClient(
-            session= str(Path(f"./sessions/{session_file_name}").absolute()),
+    def __init__(self, session_file_name: str, app_id: int, app_hash: str, session: Union[Session, None] = None):
+        self.__channel_client = InstrumentedTelegramClient(
+            session=session if session is not None else str(Path(f"./sessions/{session_file_name}").absolute()),
             api_id=app_id,
-            api_hash=app_hash
+            api_hash=app_hash,
+            # telethon would sleep through FloodWaits of up to a minute itself, the scheduler must see every one
+            flood_sleep_threshold=0
         )
 
     def create_session(self):
@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+import logging
+from typing import List, Iterable
+
+from fastapi import UploadFile
+
+from config import get_settings
+from database.database import AsyncMongoClient
+from database.models import UploadProgressDbModel, UploadFileProgressModel, UploadStatusEnum
+from telegram.uploads import UploadProgressCallback, get_upload_size
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+class UploadProgress:
+    """Per-file upload progress of one request, kept in mongo for polling; a file is written at most every
+    UPLOAD_PROGRESS_INTERVAL seconds while its parts are sent."""
+
+    def __init__(self, db: AsyncMongoClient, username: str, upload_id: str, upload_files: List[UploadFile]):
+        self.db = db
+        self.username = username
+        self.upload_id = upload_id
+        self.files = [UploadFileProgressModel(filename=upload_file.filename, size=get_upload_size(upload_file))
+                      for upload_file in upload_files]
+        self.__written_at = [0.0 for _ in upload_files]
+
+    async def start(self, cached: Iterable[int] = ()):
+        for index in cached:
+            self.files[index].status = UploadStatusEnum.cached
+        try:
+            await self.db.save_upload_progress(UploadProgressDbModel(
+                username=self.username, upload_id=self.upload_id, files=self.files,
+                expires_at=datetime.datetime.now() + datetime.timedelta(seconds=settings.UPLOAD_PROGRESS_TTL)
+            ))
+        except Exception as ex:
+            logger.error(f"cannot save progress of upload {self.upload_id}: {ex}")
+
+    def callback(self, index: int) -> UploadProgressCallback:
+        async def on_progress(uploaded_bytes: int, parts_done: int, parts: int, retries: int):
+            file = self.files[index]
+            file.uploaded_bytes, file.parts_done, file.parts, file.retries = uploaded_bytes, parts_done, parts, retries
+            file.status = UploadStatusEnum.uploading
+            now = asyncio.get_running_loop().time()
+            if now - self.__written_at[index] >= settings.UPLOAD_PROGRESS_INTERVAL:
+                self.__written_at[index] = now
+                await self.__write(index)
+
+        return on_progress
+
+    async def finish(self, index: int, status: UploadStatusEnum):
+        self.files[index].status = status
+        await self.__write(index)
+
+    async def __write(self, index: int):
+        # progress is informational, losing an update must not fail the send
+        try:
+            await self.db.update_upload_file_progress(username=self.username, upload_id=self.upload_id, index=index,
+                                                      file=self.files[index])
+        except Exception as ex:
+            logger.error(f"cannot save progress of upload {self.upload_id}: {ex}")
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Callable, Awaitable, Union, AsyncIterator
+
+from fastapi import UploadFile
+from telethon import helpers
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.upload import SaveFilePartRequest, SaveBigFilePartRequest
+from telethon.tl.types import TypeInputFile, InputFile, InputFileBig
+
+from config import get_settings
+from metrics import registry
+from telegram.telegram_client import InstrumentedTelegramClient
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# telegram takes files above this in parts of SaveBigFilePartRequest, without the md5 check
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+upload_part_retries = registry.counter("telegram_upload_part_retries_total", "File parts sent again after an error")
+
+# uploaded bytes, parts done, total parts, retried parts
+UploadProgressCallback = Callable[[int, int, int, int], Awaitable]
+
+
+class UploadStream:
+
+    def __init__(self, upload_file: UploadFile):
+        self.upload_file = upload_file
+        self.name = upload_file.filename
+
+    async def read(self, size: int = -1) -> bytes:
+        return await self.upload_file.read(size)
+
+
+def get_upload_size(upload_file: UploadFile) -> int:
+    if upload_file.size is not None:
+        return upload_file.size
+    position = upload_file.file.tell()
+    upload_file.file.seek(0, os.SEEK_END)
+    size = upload_file.file.tell()
+    upload_file.file.seek(position, os.SEEK_SET)
+    return size
+
+
+async def upload_sha256(upload_file: UploadFile, chunk_size: int = 1024 * 1024) -> str:
+    def digest() -> str:
+        sha256 = hashlib.sha256()
+        upload_file.file.seek(0)
+        for chunk in iter(lambda: upload_file.file.read(chunk_size), b""):
+            sha256.update(chunk)
+        upload_file.file.seek(0)
+        return sha256.hexdigest()
+
+    return await asyncio.get_running_loop().run_in_executor(None, digest)
+
+
+async def upload_chunks(upload_file: UploadFile, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    await upload_file.seek(0)
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def upload_stream(client: InstrumentedTelegramClient, upload_file: UploadFile,
+                        on_progress: Union[UploadProgressCallback, None] = None) -> TypeInputFile:
+    """Send the file in parts, up to UPLOAD_PARALLEL_PARTS in flight; parts of big files are spread over
+    UPLOAD_CONNECTIONS connections and each failed part is retried on its own."""
+    await upload_file.seek(0)
+    stream = UploadStream(upload_file)
+    size = get_upload_size(upload_file)
+    part_size = settings.UPLOAD_PART_SIZE_KB * 1024
+    parts = max((size + part_size - 1) // part_size, 1)
+    is_big = size > BIG_FILE_SIZE
+    file_id = helpers.generate_random_long()
+    md5 = None if is_big else hashlib.md5()
+    senders = await client.upload_senders(settings.UPLOAD_CONNECTIONS if is_big else 0)
+    slots = asyncio.Semaphore(max(settings.UPLOAD_PARALLEL_PARTS, 1))
+    state = {"uploaded": 0, "done": 0, "retries": 0}
+    errors = []
+
+    async def send_part(sender, request):
+        try:
+            for attempt in range(settings.UPLOAD_PART_RETRIES + 1):
+                try:
+                    if not await client.send_upload_part(sender, request):
+                        raise RuntimeError(f"telegram did not save part {request.file_part} of {stream.name}")
+                    break
+                except FloodWaitError as ex:
+                    if attempt == settings.UPLOAD_PART_RETRIES:
+                        raise
+                    await asyncio.sleep(ex.seconds)
+                except Exception as ex:
+                    if attempt == settings.UPLOAD_PART_RETRIES:
+                        raise
+                    logger.warning(f"retrying part {request.file_part} of {stream.name}: {ex}")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                upload_part_retries.inc()
+                state["retries"] += 1
+            state["uploaded"] += len(request.bytes)
+            state["done"] += 1
+            if on_progress is not None:
+                await on_progress(state["uploaded"], state["done"], parts, state["retries"])
+        except Exception as ex:
+            errors.append(ex)
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        for part in range(parts):
+            await slots.acquire()
+            if errors:
+                break
+            data = await stream.read(part_size)
+            if md5 is not None:
+                md5.update(data)
+            if is_big:
+                request = SaveBigFilePartRequest(file_id=file_id, file_part=part, file_total_parts=parts, bytes=data)
+            else:
+                request = SaveFilePartRequest(file_id=file_id, file_part=part, bytes=data)
+            tasks.append(asyncio.create_task(send_part(senders[part % len(senders)], request)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if errors:
+        raise errors[0]
+    if is_big:
+        return InputFileBig(id=file_id, parts=parts, name=stream.name)
+    return InputFile(id=file_id, parts=parts, name=stream.name, md5_checksum=md5.hexdigest())
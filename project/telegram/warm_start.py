@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from typing import Union, List
+
+from config import get_settings
+from database.database import AsyncMongoClient
+from database.models import SessionDbModel
+from metrics import registry, request_observers
+from telegram.client_pool import TelegramClientPool, client_pool
+from telegram.session_leases import SessionOwnedElsewhereError
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# probes and scrapes do not count as the first request
+UNOBSERVED_ROUTES = ("/health/live", "/health/ready", "/metrics", "unmatched")
+
+
+class WarmStart:
+    """Pre-connects telegram sessions of active operators after startup, the worker is ready once they are
+    connected or WARM_START_TIMEOUT has passed; slower sessions keep connecting in the background."""
+
+    def __init__(self, pool: TelegramClientPool, enabled: bool, concurrency: int, timeout: float):
+        self.pool = pool
+        self.enabled = enabled
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.sessions = 0
+        self.connected = 0
+        self.failed = 0
+        self.owned_elsewhere = 0
+        self.started_at: Union[float, None] = None
+        self.ready_at: Union[float, None] = None
+        self.first_request_seconds: Union[float, None] = None
+        self.first_request_route: Union[str, None] = None
+        self.__task: Union[asyncio.Task, None] = None
+        self.__connect_tasks: List[asyncio.Task] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def start(self, db: AsyncMongoClient):
+        self.started_at = time.monotonic()
+        if not self.enabled:
+            self.ready_at = self.started_at
+            return
+        self.__task = asyncio.create_task(self.__run(db))
+
+    async def close(self):
+        tasks = self.__connect_tasks + ([self.__task] if self.__task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__task = None
+        self.__connect_tasks = []
+
+    def observe_request(self, method: str, route: str, seconds: float):
+        if self.first_request_seconds is None and route not in UNOBSERVED_ROUTES:
+            self.first_request_seconds = seconds
+            self.first_request_route = f"{method} {route}"
+            logger.info(f"first request {self.first_request_route} took {seconds:.3f}s")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "seconds_to_ready": self.ready_at - self.started_at if self.ready else None,
+            "sessions": self.sessions,
+            "connected": self.connected,
+            "failed": self.failed,
+            "owned_elsewhere": self.owned_elsewhere,
+            "first_request_seconds": self.first_request_seconds,
+            "first_request_route": self.first_request_route,
+        }
+
+    async def __run(self, db: AsyncMongoClient):
+        try:
+            await db.ping()
+            session_ids = await db.get_operator_session_ids(limit=self.pool.max_size)
+            self.sessions = len(session_ids)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self.__connect_tasks = [asyncio.create_task(self.__connect(db, semaphore, session_id))
+                                    for session_id in session_ids]
+            if self.__connect_tasks:
+                await asyncio.wait(self.__connect_tasks, timeout=self.timeout)
+        except Exception as ex:
+            logger.error(f"warm start failed, serving cold: {ex}")
+        self.ready_at = time.monotonic()
+        logger.info(f"ready in {self.ready_at - self.started_at:.2f}s, {self.connected} of {self.sessions} telegram "
+                    f"sessions connected, {self.failed} failed, {self.owned_elsewhere} owned by other workers")
+
+    async def __connect(self, db: AsyncMongoClient, semaphore: asyncio.Semaphore, session_id: str):
+        async with semaphore:
+            try:
+                session = SessionDbModel.model_validate(await db.get_session_by_id(session_id))
+                await self.pool.acquire(session_id=session_id, session=session)
+                await self.pool.release(session_id=session_id)
+                self.connected += 1
+            except SessionOwnedElsewhereError:
+                self.owned_elsewhere += 1
+            except Exception as ex:
+                self.failed += 1
+                logger.warning(f"cannot pre-connect session {session_id}: {ex}")
+
+
+warm_start = WarmStart(
+    pool=client_pool,
+    enabled=settings.WARM_START_ENABLED,
+    concurrency=settings.WARM_START_CONCURRENCY,
+    timeout=settings.WARM_START_TIMEOUT
+)
+
+request_observers.append(warm_start.observe_request)
+
+registry.gauge("warm_start_ready", "1 once the worker finished warm start", lambda: int(warm_start.ready))
+registry.gauge("warm_start_seconds_to_ready", "Seconds from startup to ready",
+               lambda: warm_start.stats()["seconds_to_ready"])
+registry.gauge("warm_start_connected_sessions", "Telegram sessions connected by warm start",
+               lambda: warm_start.connected)
+registry.gauge("first_request_duration_seconds", "Latency of the first request after startup",
+               lambda: warm_start.first_request_seconds)
@@ -0,0 +1,19 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+
+from database.database import encode_cursor, decode_cursor, InvalidCursorError
+
+
+def test_cursor_round_trip():
+    document = {"created_at": datetime.datetime(2024, 5, 1, 12, 30), "_id": ObjectId()}
+    assert decode_cursor(encode_cursor(document)) == (document["created_at"], document["_id"])
+
+
+@pytest.mark.parametrize("cursor", ["", "no-comma", "not-a-date,0123456789abcdef01234567", "2024-05-01T12:30:00,bad"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError) as error:
+        decode_cursor(cursor)
+    assert isinstance(error.value, ValueError)
+    assert f"{error.value}" == "invalid cursor"
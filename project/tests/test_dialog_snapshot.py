@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+from typing import List
+
+from telethon.tl.types import User
+
+from telegram.dialog_snapshot import DialogSnapshot
+
+
+class FakeDb:
+
+    def __init__(self, state: dict = None):
+        self.state = state
+        self.saved: List = []
+        self.calls: List[str] = []
+
+    async def get_dialog_snapshot_state(self, session_id: str):
+        return self.state
+
+    async def mark_dialog_snapshot_stale(self, session_id: str):
+        self.calls.append("stale")
+        self.state.pop("synced_at", None)
+
+    async def mark_dialog_snapshot_synced(self, session_id: str):
+        self.calls.append("synced")
+        self.state = {**(self.state or {}), "synced_at": "now"}
+
+    async def allocate_dialog_versions(self, session_id: str, count: int = 1) -> int:
+        self.state = self.state or {"_id": session_id}
+        self.state["version"] = self.state.get("version", 0) + count
+        return self.state["version"]
+
+    async def commit_dialog_versions(self, session_id: str, version: int):
+        self.calls.append(f"commit {version}")
+        self.state["committed"] = max(self.state.get("committed", 0), version)
+
+    async def save_dialogs(self, dialogs):
+        # what a reader of the snapshot sees while the batch is written
+        self.calls.append(f"save {self.state.get('committed', 0)}/{self.state['version']}")
+        self.saved.extend(dialogs)
+
+
+class FakeClient:
+
+    def __init__(self, dialogs: int = 0):
+        self.handlers = 0
+        self.dialog_listings = 0
+        self.dialogs = dialogs
+
+    def add_event_handler(self, callback, event):
+        self.handlers += 1
+
+    async def iter_dialogs(self):
+        self.dialog_listings += 1
+        for peer_id in range(1, self.dialogs + 1):
+            yield SimpleNamespace(id=peer_id, entity=User(id=peer_id, first_name="user"), title="user",
+                                  unread_count=0, date=datetime.datetime.now(), message=None)
+
+
+def attach(snapshot: DialogSnapshot, client: FakeClient):
+
+    async def run():
+        await snapshot.attach(session_id="s", client=client)
+        await asyncio.gather(*asyncio.all_tasks() - {asyncio.current_task()})
+
+    asyncio.run(run())
+
+
+def test_first_attach_builds_snapshot():
+    db, client, snapshot = FakeDb(), FakeClient(), DialogSnapshot()
+    snapshot.start(db)
+    attach(snapshot, client)
+    assert client.handlers == 3
+    assert client.dialog_listings == 1
+    assert db.calls == ["synced"]
+
+
+def test_reattach_resyncs_snapshot_built_before_disconnect():
+    db = FakeDb(state={"_id": "s", "version": 10, "synced_at": "before disconnect"})
+    client, snapshot = FakeClient(), DialogSnapshot()
+    snapshot.start(db)
+    attach(snapshot, client)
+    assert client.dialog_listings == 1
+    assert db.calls == ["stale", "synced"]
+    assert db.state["synced_at"] == "now"
+
+
+def test_versions_are_committed_after_the_dialogs_are_written():
+    db, client, snapshot = FakeDb(), FakeClient(dialogs=3), DialogSnapshot()
+    snapshot.start(db)
+    attach(snapshot, client)
+    assert [dialog.version for dialog in db.saved] == [1, 2, 3]
+    assert db.calls == ["save 0/3", "commit 3", "synced"]
+    assert db.state["committed"] == 3
@@ -0,0 +1,61 @@
+import asyncio
+
+from bson import ObjectId
+
+from database.job_events import JobEvents
+from database.models import JobEventEnum
+
+
+class FakeDb:
+
+    def __init__(self):
+        self.events = []
+
+    async def publish_job_event(self, job_id: ObjectId, event: JobEventEnum, data=None):
+        self.events.append({"_id": ObjectId(), "job_id": job_id, "event": event, **(data or {})})
+
+    async def get_last_job_event_id(self):
+        return self.events[-1]["_id"] if self.events else None
+
+    def tail_job_events(self, after):
+        return FakeCursor([event for event in self.events if after is None or event["_id"] > after])
+
+
+class FakeCursor:
+    """Like a tailable cursor on a collection without cap: returns what is there and closes."""
+
+    def __init__(self, events):
+        self.events = events
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.events:
+            self.alive = False
+            raise StopAsyncIteration
+        return self.events.pop(0)
+
+
+def test_events_reach_subscriber_and_wake_runner():
+    db, job_events, job_id = FakeDb(), JobEvents(), ObjectId()
+
+    async def run():
+        job_events.start(db)
+        await asyncio.sleep(0.01)
+        events = job_events.subscribe(job_id)
+        await job_events.publish(job_id=ObjectId(), event=JobEventEnum.queued)
+        await job_events.wait_queued(timeout=5)
+        await job_events.publish(job_id=job_id, event=JobEventEnum.output, data={"index": 0, "line": "a\n"})
+        await job_events.publish(job_id=ObjectId(), event=JobEventEnum.finished)
+        await job_events.publish(job_id=job_id, event=JobEventEnum.finished)
+        received = [await asyncio.wait_for(events.get(), timeout=5) for _ in range(2)]
+        job_events.unsubscribe(job_id)
+        await job_events.close()
+        return received
+
+    received = asyncio.run(run())
+    assert [(event["event"], event.get("line")) for event in received] == [(JobEventEnum.output, "a\n"),
+                                                                         (JobEventEnum.finished, None)]
+    assert job_events.events == 4
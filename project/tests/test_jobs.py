@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api import jobs
+from database.models import JobDbModel, JobFileModel, ActionsEnum, JobStatusEnum, UserDbModel, JobEventEnum
+
+CONTENTS = {"a": b"x" * (jobs.JOB_FILE_SPOOL_SIZE + 1), "b": b"small"}
+
+
+class FakeDb:
+
+    def __init__(self, jobs_to_claim=()):
+        self.jobs_to_claim = list(jobs_to_claim)
+        self.finished = {}
+        self.requeued = {}
+
+    async def download_job_file(self, file_id: str, destination):
+        destination.write(CONTENTS[file_id])
+
+    async def claim_job(self, owner: str, lease_seconds: float, excluded_sessions=None):
+        return self.jobs_to_claim.pop(0) if self.jobs_to_claim else None
+
+    async def requeue_job(self, job_id: ObjectId, not_before: datetime.datetime):
+        self.requeued[job_id] = not_before
+
+    async def finish_job(self, job_id: ObjectId, job_status: JobStatusEnum, result=None, error=None):
+        self.finished[job_id] = (job_status, result, error)
+
+    async def get_user_by_login(self, username: str) -> UserDbModel:
+        return UserDbModel(username=username, user_hashed_password="", user_session_id="s")
+
+    async def renew_job_lease(self, job_id: ObjectId, owner: str, lease_seconds: float):
+        pass
+
+    async def delete_job_files(self, job_id: ObjectId):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_foreign_sessions(monkeypatch):
+    async def foreign_sessions():
+        return []
+
+    monkeypatch.setattr(jobs.session_leases, "foreign_sessions", foreign_sessions)
+
+
+def make_job(session_id=None) -> dict:
+    return {"_id": ObjectId(), **JobDbModel(job_type=ActionsEnum.like_message, username="operator",
+                                            session_id=session_id, payload={}).model_dump()}
+
+
+def run_jobs(db: FakeDb, until) -> jobs.JobRunner:
+    runner = jobs.JobRunner(workers=1, poll_interval=0.01, lease_seconds=60)
+
+    async def run():
+        runner.start(db)
+        while not until():
+            await asyncio.sleep(0.01)
+        await runner.close()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    return runner
+
+
+def test_send_message_job_reads_files_from_database(monkeypatch):
+    received = {}
+
+    async def send_message(message, upload_files, user, db, async_mode):
+        for upload_file in upload_files:
+            received[upload_file.filename] = (await upload_file.read(), upload_file.size)
+        return "sent"
+
+    monkeypatch.setattr(jobs.users, "send_message", send_message)
+    job = JobDbModel(job_type=ActionsEnum.send_message, username="operator", session_id="s",
+                     payload={"chat_id": 1, "text_message": "hello"},
+                     files=[JobFileModel(file_id=file_id, filename=f"{file_id}.bin", size=len(content))
+                            for file_id, content in CONTENTS.items()])
+    assert asyncio.run(jobs.run_send_message(db=FakeDb(), user=None, job=job)) == "sent"
+    assert received == {f"{file_id}.bin": (content, len(content)) for file_id, content in CONTENTS.items()}
+
+
+def test_response_of_handler_is_stored_as_job_result(monkeypatch):
+    async def handed_over(db, user, job):
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "success", "job_id": "other"})
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, ActionsEnum.like_message, handed_over)
+    job = make_job()
+    db = FakeDb(jobs_to_claim=[job])
+    run_jobs(db, until=lambda: db.finished)
+    assert db.finished[job["_id"]] == (JobStatusEnum.succeeded, {"status": "success", "job_id": "other"}, None)
+
+
+def test_error_response_of_handler_fails_job(monkeypatch):
+    async def failed(db, user, job):
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"detail": "boom"})
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, ActionsEnum.like_message, failed)
+    job = make_job()
+    db = FakeDb(jobs_to_claim=[job])
+    run_jobs(db, until=lambda: db.finished)
+    assert db.finished[job["_id"]] == (JobStatusEnum.failed, None, "boom")
+
+
+def test_job_of_session_leased_elsewhere_is_requeued_with_backoff(monkeypatch):
+    async def try_acquire(session_id: str) -> bool:
+        return False
+
+    monkeypatch.setattr(jobs.session_leases, "try_acquire", try_acquire)
+    job = make_job(session_id="s")
+    db = FakeDb(jobs_to_claim=[job])
+    claimed_at = datetime.datetime.now()
+    run_jobs(db, until=lambda: db.requeued)
+    assert db.requeued[job["_id"]] >= claimed_at + datetime.timedelta(seconds=0.01)
+    assert not db.finished
+
+
+def test_streamed_lines_are_relayed_and_kept_in_result(monkeypatch):
+    published = []
+
+    async def publish(job_id, event, data=None):
+        published.append((event, data))
+
+    async def lines():
+        yield '{"index":0}\n'
+        yield '{"index":1}\n'
+
+    async def streaming(db, user, job):
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    monkeypatch.setattr(jobs.job_events, "publish", publish)
+    monkeypatch.setitem(jobs.JOB_HANDLERS, ActionsEnum.like_message, streaming)
+    job = make_job()
+    db = FakeDb(jobs_to_claim=[job])
+    run_jobs(db, until=lambda: db.finished and published[-1][0] == JobEventEnum.finished)
+    assert db.finished[job["_id"]] == (JobStatusEnum.succeeded, {"lines": ['{"index":0}\n', '{"index":1}\n']}, None)
+    assert published == [(JobEventEnum.output, {"index": 0, "line": '{"index":0}\n'}),
+                         (JobEventEnum.output, {"index": 1, "line": '{"index":1}\n'}),
+                         (JobEventEnum.finished, None)]
@@ -0,0 +1,37 @@
+import os
+import time
+
+from metrics import MetricsRegistry, MetricsExchange
+
+
+def make_worker(directory: str, worker: str, requests: int, active: float) -> MetricsExchange:
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", ("route",))
+    histogram = registry.histogram("request_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    registry.gauge("active_jobs", "Jobs", lambda: active)
+    for _ in range(requests):
+        counter.inc("/users")
+        histogram.observe(0.5, "/users")
+    return MetricsExchange(registry=registry, directory=directory, interval=1, worker=worker)
+
+
+def test_scrape_of_any_worker_covers_all(tmp_path):
+    first = make_worker(str(tmp_path), "web:1", requests=2, active=1)
+    second = make_worker(str(tmp_path), "web:2", requests=3, active=4)
+    first.write()
+    lines = second.render().splitlines()
+    assert 'requests_total{route="/users"} 5.0' in lines
+    assert 'request_seconds_bucket{route="/users",le="1.0"} 5.0' in lines
+    assert 'request_seconds_sum{route="/users"} 2.5' in lines
+    assert 'active_jobs{worker="web:1"} 1.0' in lines
+    assert 'active_jobs{worker="web:2"} 4.0' in lines
+
+
+def test_exited_worker_keeps_counters_but_not_gauges(tmp_path):
+    exited = make_worker(str(tmp_path), "web:1", requests=2, active=1)
+    exited.write()
+    written_at = time.time() - 10
+    os.utime(tmp_path / "web_1.json", (written_at, written_at))
+    lines = make_worker(str(tmp_path), "web:2", requests=1, active=0).render().splitlines()
+    assert 'requests_total{route="/users"} 3.0' in lines
+    assert not any(line.startswith('active_jobs{worker="web:1"}') for line in lines)
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from telethon.errors import FloodWaitError
+from telethon.sessions import MemorySession
+from telethon.tl import functions
+
+from telegram.scheduler import SessionScheduler, RpcKind, SchedulerBusyError
+from telegram.telegram_client import InstrumentedTelegramClient, TelegramAccount
+
+
+def make_scheduler(max_wait: float = 120, max_flood_retries: int = 3) -> SessionScheduler:
+    return SessionScheduler(limits={kind: (1000, 1000) for kind in RpcKind}, max_wait=max_wait,
+                            max_flood_retries=max_flood_retries)
+
+
+class FloodingOperation:
+
+    def __init__(self, seconds: int, floods: int):
+        self.seconds = seconds
+        self.floods = floods
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.floods:
+            raise FloodWaitError(request=None, capture=self.seconds)
+        return "sent"
+
+
+def test_flood_wait_is_retried_after_the_wait():
+    scheduler = make_scheduler()
+    operation = FloodingOperation(seconds=0, floods=2)
+    assert asyncio.run(scheduler.run(session_id="s", kind=RpcKind.send, operation=operation)) == "sent"
+    assert operation.calls == 3
+    assert scheduler.flood_waits == 2
+
+
+def test_flood_wait_longer_than_max_wait_raises_busy_without_sleeping():
+    scheduler = make_scheduler(max_wait=5)
+    operation = FloodingOperation(seconds=3600, floods=1)
+
+    async def run():
+        return await asyncio.wait_for(scheduler.run(session_id="s", kind=RpcKind.send, operation=operation),
+                                      timeout=1)
+
+    with pytest.raises(SchedulerBusyError) as error:
+        asyncio.run(run())
+    assert operation.calls == 1
+    assert 3590 < error.value.retry_after <= 3600
+
+
+def test_flood_retries_are_capped():
+    scheduler = make_scheduler(max_flood_retries=2)
+    operation = FloodingOperation(seconds=0, floods=10)
+    with pytest.raises(SchedulerBusyError):
+        asyncio.run(scheduler.run(session_id="s", kind=RpcKind.send, operation=operation))
+    assert operation.calls == 3
+
+
+def test_queued_call_fails_fast_when_session_is_parked_past_max_wait():
+    scheduler = make_scheduler(max_wait=5)
+
+    async def run():
+        with pytest.raises(SchedulerBusyError):
+            await scheduler.run(session_id="s", kind=RpcKind.send, operation=FloodingOperation(seconds=60, floods=1))
+        with pytest.raises(SchedulerBusyError):
+            await asyncio.wait_for(scheduler.run(session_id="s", kind=RpcKind.send,
+                                                 operation=FloodingOperation(seconds=0, floods=0)), timeout=1)
+        assert scheduler.status(session_id="s")["send"]["queue_depth"] == 0
+
+    asyncio.run(run())
+
+
+class FloodingSender:
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.sends = 0
+
+    def send(self, request, ordered=False):
+        self.sends += 1
+        return self.__flood()
+
+    async def __flood(self):
+        raise FloodWaitError(request=None, capture=self.seconds)
+
+
+def test_flood_wait_of_client_reaches_scheduler(monkeypatch):
+    async def connect(self):
+        pass
+
+    monkeypatch.setattr(InstrumentedTelegramClient, "connect", connect)
+    scheduler = make_scheduler(max_wait=5)
+    sender = FloodingSender(seconds=30)
+
+    async def run():
+        # a FloodWait below telethon's default threshold of 60 seconds, which it would sleep through itself
+        client = await TelegramAccount(session_file_name="", app_id=1, app_hash="hash",
+                                       session=MemorySession()).get_client()
+        client._sender = sender
+        return await asyncio.wait_for(scheduler.run(session_id="s", kind=RpcKind.send,
+                                                    operation=lambda: client(functions.help.GetConfigRequest())),
+                                      timeout=1)
+
+    with pytest.raises(SchedulerBusyError) as error:
+        asyncio.run(run())
+    assert sender.sends == 1
+    assert scheduler.flood_waits == 1
+    assert 25 < error.value.retry_after <= 30